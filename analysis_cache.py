@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Optional
+
+# Eviction scans the whole table, so a process only sweeps after writing this
+# share of max_bytes since its last sweep; between sweeps the cache may exceed
+# max_bytes by about that much per writing process
+EVICT_SHARE = 0.05
+
+
+def file_sha256(file_obj, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 of an uploaded file object, leaving its position at the start"""
+    digest = hashlib.sha256()
+    file_obj.seek(0)
+    for chunk in iter(lambda: file_obj.read(chunk_size), b''):
+        digest.update(chunk)
+    file_obj.seek(0)
+    return digest.hexdigest()
+
+
+class AnalysisCache:
+    """Content-addressed, disk-backed cache for extracted text and analyses.
+
+    Entries live in a single SQLite file (WAL mode), so every process and
+    docker-compose replica mounting the same volume shares them. Entries
+    expire after ttl_seconds, and the least recently used ones are evicted
+    once the stored payloads exceed max_bytes (checked every EVICT_SHARE of
+    max_bytes written, and on a process's first write).
+    """
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024, ttl_seconds: int = 30 * 24 * 3600):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._unswept = max_bytes
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created REAL NOT NULL,"
+                " accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+
+    @classmethod
+    def from_env(cls) -> Optional["AnalysisCache"]:
+        """Build the cache from ANALYSIS_CACHE_* environment variables (None if disabled)"""
+        path = os.getenv('ANALYSIS_CACHE_PATH', '.cache/analysis.sqlite3')
+        if not path:
+            return None
+        return cls(
+            path,
+            max_bytes=int(os.getenv('ANALYSIS_CACHE_MAX_MB', '256')) * 1024 * 1024,
+            ttl_seconds=int(os.getenv('ANALYSIS_CACHE_TTL', str(30 * 24 * 3600))),
+        )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def make_key(*parts: str) -> str:
+        """Join key components (document hash, model, prompt version, ...)"""
+        return ":".join(parts)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for key, or None on a miss or expired entry"""
+        try:
+            now = time.time()
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT value, created FROM entries WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                if now - row[1] > self.ttl_seconds:
+                    conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    return None
+                conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            return json.loads(row[0])
+        except Exception as e:
+            logging.error(f"Analysis cache read error: {str(e)}")
+            return None
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Return {key: value} for the keys that are cached, in one transaction"""
+        keys = list(keys)
+        found = {}
+        try:
+            now = time.time()
+            with self._connect() as conn:
+                # Stay well under SQLite's bound-parameter limit
+                for start in range(0, len(keys), 500):
+                    batch = keys[start:start + 500]
+                    placeholders = ",".join("?" * len(batch))
+                    rows = conn.execute(
+                        f"SELECT key, value FROM entries WHERE key IN ({placeholders}) AND created >= ?",
+                        (*batch, now - self.ttl_seconds)
+                    ).fetchall()
+                    conn.execute(
+                        f"UPDATE entries SET accessed = ? WHERE key IN ({placeholders})", (now, *batch)
+                    )
+                    found.update((key, json.loads(value)) for key, value in rows)
+        except Exception as e:
+            logging.error(f"Analysis cache read error: {str(e)}")
+        return found
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a JSON-serialisable value, then enforce TTL and the size bound when due"""
+        self.set_many({key: value})
+
+    def set_many(self, items: Dict[str, Any]) -> None:
+        """Store several values in one transaction, then enforce TTL and the size bound when due"""
+        if not items:
+            return
+        try:
+            now = time.time()
+            rows = [(key, payload, len(payload), now, now)
+                    for key, payload in ((key, json.dumps(value)) for key, value in items.items())]
+            with self._connect() as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO entries (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                    rows
+                )
+                if self._sweep_due(sum(row[2] for row in rows)):
+                    self._evict(conn, now)
+        except Exception as e:
+            logging.error(f"Analysis cache write error: {str(e)}")
+
+    def _sweep_due(self, written: int) -> bool:
+        """Count written bytes; True once EVICT_SHARE of max_bytes has been written since the last sweep"""
+        with self._lock:
+            self._unswept += written
+            if self._unswept < EVICT_SHARE * self.max_bytes:
+                return False
+            self._unswept = 0
+            return True
+
+    def _evict(self, conn, now: float):
+        """Drop expired entries, then the least recently used beyond max_bytes if the total exceeds it"""
+        conn.execute("DELETE FROM entries WHERE created < ?", (now - self.ttl_seconds,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        conn.execute(
+            "DELETE FROM entries WHERE key IN ("
+            " SELECT key FROM ("
+            "  SELECT key, SUM(size) OVER (ORDER BY accessed DESC, key) AS running FROM entries"
+            " ) WHERE running > ?)",
+            (self.max_bytes,)
+        )
+
+
+_cache = None
+_cache_loaded = False
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> Optional[AnalysisCache]:
+    """Return the process-wide analysis cache, or None if it is disabled"""
+    global _cache, _cache_loaded
+    with _cache_lock:
+        if not _cache_loaded:
+            try:
+                _cache = AnalysisCache.from_env()
+            except Exception as e:
+                logging.error(f"Analysis cache unavailable: {str(e)}")
+                _cache = None
+            _cache_loaded = True
+        return _cache
@@ -1,77 +1,293 @@
-from flask import Flask, request, jsonify
-from pdf_processor import PDFProcessor
-from openrouter_client import OpenRouterClient
+from flask import Flask, Response, request, jsonify, url_for
+from werkzeug.middleware.proxy_fix import ProxyFix
+from dotenv import load_dotenv
+from pdf_processor import PDFProcessor, PDFSource
+from openrouter_client import ANALYSES, OpenRouterClient
 from visualization_handler import VisualizationHandler
+from analysis_cache import file_sha256
+import progress
+from jobs import JOB_STORE_PATH, JobManager, JobStore
+from rate_limiter import get_rate_limiter
+from utils import validate_pdf_file
+import threading
+import json
+import time
+import os
 
+load_dotenv()
 app = Flask(__name__)
 
+# Reverse proxies in front of the API (nginx in docker-compose); the client
+# address, which rate limits are keyed on, is taken from X-Forwarded-For
+TRUSTED_PROXIES = int(os.getenv('API_TRUSTED_PROXIES', '1'))
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES)
+
+# Job stages, in the order they usually finish
+STAGES = ["extract"] + list(ANALYSES)
+
+# Response key and VisualizationHandler method for the analyses returned as figures
+FIGURES = {
+    "structure": ("structure_fig", "create_document_structure_visualization"),
+    "word_cloud": ("word_cloud_fig", "create_word_cloud_visualization"),
+}
+
+
+def figure_json(figure) -> dict:
+    """JSON-safe dict for a Plotly figure (to_dict() keeps numpy arrays)"""
+    return json.loads(figure.to_json())
+
+
 class App:
     def __init__(self):
         self.pdf_processor = PDFProcessor()
-        self.client = OpenRouterClient()
+        self.client = OpenRouterClient(api_key=os.getenv('OPENROUTER_API_KEY'))
         self.viz_handler = VisualizationHandler()
 
+    def _result_data(self, name: str, result: dict) -> dict:
+        """Response entries for one finished analysis (figures for structure and word cloud)"""
+        if name not in FIGURES:
+            return {name: result}
+        key, method = FIGURES[name]
+        return {key: figure_json(getattr(self.viz_handler, method)(result))}
+
+    def analyse(self, pdf_file, on_update=None) -> dict:
+        """Extract and analyse an upload, returning the /upload response data.
+
+        on_update(stage, status, data, **fields) reports the pipeline's
+        progress events (see progress): the extract stage with its page
+        counts and timing ("cached" if no page had to be read), each
+        analysis when it starts, and each analysis with its response
+        entries and duration as soon as it finishes.
+        """
+        report = on_update or (lambda *args, **kwargs: None)
+        document_hash = file_sha256(pdf_file)
+        data, reported, durations = {}, set(), {}
+        lock = threading.Lock()
+        started = time.time()
+        extract = {"last": 0.0}
+
+        def on_event(event):
+            kind = event["event"]
+            elapsed = round(event["time"] - started, 3)
+            if kind == progress.PAGES_EXTRACTED:
+                # Page events are reported at most twice a second
+                done = event["pages"] == event["total"]
+                if done or event["time"] - extract["last"] >= 0.5:
+                    extract["last"] = event["time"]
+                    report(
+                        "extract", "done" if done else "running", None,
+                        pages=event["pages"], total=event["total"], elapsed=elapsed
+                    )
+                if done:
+                    reported.add("extract")
+            elif kind == progress.ANALYSIS_STARTED:
+                report(event["name"], "running", None, started=elapsed)
+            elif kind == progress.ANALYSIS_FINISHED:
+                # Emitted just before on_result, which reports the entries
+                durations[event["name"]] = event
+
+        def on_result(name, result):
+            failed = isinstance(result, dict) and 'error' in result
+            entries = self._result_data(name, result)
+            with lock:
+                data.update(entries)
+                reported.add(name)
+            finished = durations.get(name, {})
+            report(
+                name, "failed" if failed else "done", entries,
+                seconds=finished.get("seconds", 0.0), cached=finished.get("cached", False)
+            )
+
+        # Extract and preprocess pages lazily so the first analyses start
+        # while later pages are still being extracted. The upload is read
+        # in place or memory-mapped rather than copied into memory.
+        with PDFSource(pdf_file) as source:
+            pages = self.client.preprocess_pages(
+                self.pdf_processor.iter_pages(source, cache=self.client.cache, on_event=on_event)
+            )
+            # Cached results skip extraction entirely
+            results = self.client.analyze_pages(
+                pages, on_result=on_result, document_hash=document_hash, on_event=on_event
+            )
+        if "extract" not in reported:
+            report("extract", "cached", None)
+        for name, result in results.items():
+            if name not in reported:
+                data.update(self._result_data(name, result))
+        return data
+
     def process_pdf(self, pdf_file):
         try:
-            # Extract text from PDF
-            raw_text = self.pdf_processor.extract_text(pdf_file)
-            
-            # Preprocess the text
-            processed_text = self.client.preprocess_text(raw_text)
-            
-            # Get all analyses from OpenRouter
-            results = {
-                'summary': self.client.summarize_text(processed_text),
-                'structure': self.client.analyze_document_structure(processed_text),
-                'word_cloud': self.client.generate_word_cloud_data(processed_text),
-                'schedule': self.client.extract_schedule(processed_text)
-            }
-            
-            # Generate visualizations
-            visualizations = {
-                'structure_viz': self.viz_handler.create_document_structure_visualization(
-                    results['structure']
-                ).to_dict(),  # Convert Plotly figure to JSON-serializable format
-                'word_cloud_viz': self.viz_handler.create_word_cloud_visualization(
-                    results['word_cloud']
-                ).to_dict()  # Convert Plotly figure to JSON-serializable format
-            }
-            
             return {
                 'success': True,
-                'data': {
-                    'summary': results['summary'],
-                    'schedule': results['schedule'],
-                    'structure_fig': visualizations['structure_viz'],
-                    'word_cloud_fig': visualizations['word_cloud_viz']
-                }
+                'data': self.analyse(pdf_file)
             }
-            
+
         except Exception as e:
             return {
                 'success': False,
                 'error': str(e)
             }
 
-@app.route('/upload', methods=['POST'])
-def upload_file():
+    def run_job(self, job, path: str):
+        """Job runner: analyse a spooled upload, recording per-stage status and partial results"""
+        def on_update(stage, status, data, **fields):
+            job.update(stage, status, results=data, **fields)
+
+        with open(path, 'rb') as f:
+            self.analyse(f, on_update)
+
+    def stream_summary(self, pdf_file):
+        """Extract the PDF up front, then return a generator of SSE summary events"""
+        document_hash = file_sha256(pdf_file)
+        raw_text = self.pdf_processor.extract_text_cached(pdf_file, document_hash, self.client.cache)
+        processed_text = self.client.preprocess_text(raw_text)
+
+        def events():
+            try:
+                for token in self.client.stream_summary(processed_text, document_hash=document_hash):
+                    yield f"data: {json.dumps({'token': token})}\n\n"
+                yield "event: done\ndata: {}\n\n"
+            except Exception as e:
+                yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+
+        return events()
+
+
+_app = None
+_jobs = None
+_lock = threading.Lock()
+
+
+def get_app() -> App:
+    """Long-lived processor and client shared by every request and job in this process"""
+    global _app
+    with _lock:
+        if _app is None:
+            _app = App()
+        return _app
+
+
+def get_jobs() -> JobManager:
+    """Background job pool of this process"""
+    global _jobs
+    app_instance = get_app()
+    with _lock:
+        if _jobs is None:
+            _jobs = JobManager(app_instance.run_job, STAGES, JobStore(JOB_STORE_PATH))
+        return _jobs
+
+
+def shutdown(wait: bool = True):
+    """Stop this process's job pool, by default letting queued and running jobs finish"""
+    with _lock:
+        jobs = _jobs
+    if jobs is not None:
+        jobs.shutdown(wait=wait)
+
+
+def _client_key() -> str:
+    """Rate-limit key of the requesting client"""
+    return f"ip:{request.remote_addr}"
+
+
+def _rate_limited():
+    """A 429 response if the client has used up its analyses for now, else None"""
+    allowed, retry_after = get_rate_limiter().hit(_client_key())
+    if allowed:
+        return None
+    return (
+        jsonify({'success': False, 'error': 'Request limit reached, please try again later'}),
+        429,
+        {'Retry-After': str(int(retry_after) + 1)}
+    )
+
+
+def _uploaded_pdf():
+    """The request's validated PDF upload, or an error response"""
     if 'file' not in request.files:
-        return jsonify({'success': False, 'error': 'No file uploaded'}), 400
-        
+        return None, (jsonify({'success': False, 'error': 'No file uploaded'}), 400)
+
     file = request.files['file']
     if file.filename == '':
-        return jsonify({'success': False, 'error': 'No file selected'}), 400
-        
-    if file and file.filename.endswith('.pdf'):
-        app_instance = App()
-        result = app_instance.process_pdf(file)
-        
-        if result['success']:
-            return jsonify(result['data'])
-        else:
-            return jsonify({'error': result['error']}), 500
-    
-    return jsonify({'success': False, 'error': 'Invalid file type'}), 400
+        return None, (jsonify({'success': False, 'error': 'No file selected'}), 400)
+
+    if not file.filename.endswith('.pdf'):
+        return None, (jsonify({'success': False, 'error': 'Invalid file type'}), 400)
+
+    if not validate_pdf_file(file):
+        return None, (jsonify({'success': False, 'error': 'Invalid PDF file'}), 400)
+    return file, None
+
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """Queue an upload for background analysis; poll the returned status_url"""
+    file, error = _uploaded_pdf()
+    if error is not None:
+        return error
+
+    limited = _rate_limited()
+    if limited is not None:
+        return limited
+
+    job_id = get_jobs().submit(file)
+    if job_id is None:
+        # The queue is full: the client may retry without it counting against them
+        get_rate_limiter().refund(_client_key())
+        return jsonify({'success': False, 'error': 'Too many jobs in progress, retry shortly'}), 503, {'Retry-After': '5'}
+
+    status_url = url_for('job_status', job_id=job_id)
+    return jsonify({'success': True, 'job_id': job_id, 'status_url': status_url}), 202, {'Location': status_url}
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Job status, per-stage status and the results of the stages finished so far"""
+    job = get_jobs().get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Unknown or expired job'}), 404
+    return jsonify(job)
+
+
+@app.route('/upload', methods=['POST'])
+def upload_file():
+    file, error = _uploaded_pdf()
+    if error is not None:
+        return error
+
+    limited = _rate_limited()
+    if limited is not None:
+        return limited
+
+    result = get_app().process_pdf(file)
+
+    if result['success']:
+        return jsonify(result['data'])
+    else:
+        return jsonify({'error': result['error']}), 500
+
+
+@app.route('/summary/stream', methods=['POST'])
+def stream_summary():
+    file, error = _uploaded_pdf()
+    if error is not None:
+        return error
+
+    limited = _rate_limited()
+    if limited is not None:
+        return limited
+
+    try:
+        events = get_app().stream_summary(file)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    # Disable nginx buffering so tokens reach the client as they arrive
+    return Response(events, mimetype='text/event-stream', headers={'X-Accel-Buffering': 'no'})
+
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    # Development server; in production run gunicorn -c gunicorn.conf.py app:app
+    app.run(debug=True)
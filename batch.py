@@ -0,0 +1,201 @@
+"""Headless batch ingestion: analyse every PDF in a directory.
+
+    python batch.py outlines/ --output results.jsonl --extract-workers 4 --llm-workers 2
+
+Writes one JSON line per document with per-stage timings and the characters
+and tokens saved by stripping repeated headers and footers. The output file
+doubles as the checkpoint: documents already recorded with status "ok"
+(matched by content hash) are skipped, so an interrupted or rate-limited
+run can simply be restarted. Failed documents are retried on the next run.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Set
+
+from dotenv import load_dotenv
+
+from analysis_cache import file_sha256, get_cache
+from pdf_processor import PDFProcessor
+from openrouter_client import OpenRouterClient
+from text_normaliser import normalise_text
+
+
+def find_pdfs(directory: str) -> List[str]:
+    """All PDF paths under directory, in a stable order"""
+    paths = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.lower().endswith('.pdf'):
+                paths.append(os.path.join(root, name))
+    return sorted(paths)
+
+
+def load_checkpoint(output_path: str) -> Set[str]:
+    """Content hashes of documents already processed successfully"""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by a crash
+            if record.get('status') == 'ok':
+                done.add(record['sha256'])
+    return done
+
+
+def extract_document(path: str, document_hash: str) -> Dict:
+    """Extraction stage, run on a thread: extract and preprocess one PDF.
+
+    The parsing itself happens in the extraction sandbox's worker processes;
+    parallelism comes from running several documents at once, so each one
+    is extracted as a single job.
+    """
+    started = time.perf_counter()
+    with open(path, 'rb') as f:
+        raw_text = PDFProcessor.extract_text_cached(f, document_hash, get_cache(), workers=1)
+    extracted = time.perf_counter()
+    text, normalisation = normalise_text(raw_text)
+    return {
+        "path": path,
+        "sha256": document_hash,
+        "text": text,
+        "normalisation": normalisation,
+        "timings": {
+            "extract": round(extracted - started, 3),
+            "preprocess": round(time.perf_counter() - extracted, 3),
+        },
+    }
+
+
+def analyse_document(client: OpenRouterClient, document: Dict) -> Dict:
+    """Upstream stage, run on a thread: all analyses for one extracted document"""
+    started = time.perf_counter()
+    timings = dict(document["timings"])
+
+    def on_result(name, result):
+        timings[name] = round(time.perf_counter() - started, 3)
+
+    results = client.analyze_all(document["text"], on_result=on_result, document_hash=document["sha256"])
+    timings["analyses"] = round(time.perf_counter() - started, 3)
+    failed = sorted(name for name, result in results.items() if isinstance(result, dict) and 'error' in result)
+    return {
+        "path": document["path"],
+        "sha256": document["sha256"],
+        "status": "error" if failed else "ok",
+        "failed": failed,
+        "timings": timings,
+        "normalisation": document["normalisation"],
+        "results": results,
+    }
+
+
+def run(
+    directory: str,
+    output_path: str,
+    client: OpenRouterClient,
+    extract_workers: int = 2,
+    llm_workers: int = 2,
+    limit: Optional[int] = None,
+    max_consecutive_errors: int = 5,
+) -> Dict[str, int]:
+    """Process a directory, appending records to output_path. Returns counts by status.
+
+    Stops early after max_consecutive_errors failed analyses in a row
+    (usually upstream rate limiting); rerunning resumes where it left off.
+    """
+    done = load_checkpoint(output_path)
+    paths = find_pdfs(directory)
+    if limit is not None:
+        paths = paths[:limit]
+    counts = {"ok": 0, "error": 0, "skipped": 0}
+    consecutive_errors = 0
+
+    with open(output_path, 'a') as output, \
+            ThreadPoolExecutor(max_workers=extract_workers) as extract_pool, \
+            ThreadPoolExecutor(max_workers=llm_workers) as llm_pool:
+
+        def write(record):
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+            os.fsync(output.fileno())
+            counts[record["status"]] = counts.get(record["status"], 0) + 1
+            logging.info(f"{record['status']}: {record['path']} {record['timings']}")
+
+        pending = {}
+        for path in paths:
+            try:
+                with open(path, 'rb') as f:
+                    document_hash = file_sha256(f)
+            except OSError as e:
+                write({"path": path, "sha256": None, "status": "error", "error": str(e), "timings": {}})
+                continue
+            if document_hash in done:
+                counts["skipped"] += 1
+                logging.info(f"skipped (already processed): {path}")
+                continue
+            # Also guards against the same content appearing twice in one run
+            done.add(document_hash)
+            pending[extract_pool.submit(extract_document, path, document_hash)] = ("extract", path, document_hash)
+
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, path, document_hash = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    write({"path": path, "sha256": document_hash, "status": "error", "error": str(e), "timings": {}})
+                    continue
+                if stage == "analyse":
+                    write(result)
+                    consecutive_errors = consecutive_errors + 1 if result["status"] == "error" else 0
+                    if consecutive_errors >= max_consecutive_errors:
+                        logging.error(f"{consecutive_errors} consecutive failures, stopping; rerun to resume")
+                        for other in pending:
+                            other.cancel()
+                        return counts
+                else:
+                    pending[llm_pool.submit(analyse_document, client, result)] = ("analyse", path, document_hash)
+    return counts
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Batch-analyse a directory of course outline PDFs")
+    parser.add_argument("directory", help="Directory to walk for PDFs")
+    parser.add_argument("--output", default="batch_results.jsonl", help="JSONL output and checkpoint file")
+    parser.add_argument("--model", default="google/gemini-pro", help="OpenRouter model id")
+    parser.add_argument("--extract-workers", type=int, default=os.cpu_count() or 2,
+                        help="Documents extracted at the same time (in sandboxed worker processes)")
+    parser.add_argument("--llm-workers", type=int, default=2,
+                        help="Documents analysed upstream at the same time")
+    parser.add_argument("--limit", type=int, help="Only process the first N PDFs")
+    parser.add_argument("--max-consecutive-errors", type=int, default=5,
+                        help="Stop after this many failed documents in a row (e.g. rate limiting)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    api_key = os.getenv('OPENROUTER_API_KEY')
+    if not api_key:
+        print("OPENROUTER_API_KEY is not set", file=sys.stderr)
+        return 1
+
+    client = OpenRouterClient(api_key=api_key, model=args.model)
+    counts = run(
+        args.directory, args.output, client,
+        args.extract_workers, args.llm_workers, args.limit, args.max_consecutive_errors
+    )
+    print(f"Done: {counts['ok']} ok, {counts['error']} failed, {counts['skipped']} skipped")
+    return 0 if counts['error'] == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
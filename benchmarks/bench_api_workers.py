@@ -0,0 +1,177 @@
+"""Requests/second of the JSON API under gunicorn as the worker count grows.
+
+    python benchmarks/bench_api_workers.py outline.pdf --workers 1 2 4 8 --threads 1
+
+Starts a mock OpenRouter upstream that answers every completion after
+--latency seconds, then, for each worker count, starts gunicorn with
+gunicorn.conf.py (analysis cache and rate limit disabled, so every
+request goes upstream) and has --clients concurrent clients POST the PDF
+to /upload for --duration seconds. Prints requests/second, mean and p95 latency and
+the error count per worker count.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+import subprocess
+from typing import Tuple
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Minimal valid answers for each analysis prompt
+_STRUCTURE = '{"sections": [{"title": "Overview", "level": 1, "subsections": []}]}'
+_KEYWORDS = '[{"word": "analysis", "score": 90}]'
+_SCHEDULE = '{"milestones": [], "weekly_plan": [{"week": 1, "topic": "Introduction", "activities": []}]}'
+
+
+def mock_upstream(latency: float) -> ThreadingHTTPServer:
+    """OpenRouter-compatible /chat/completions endpoint on a free local port"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            prompt = request['messages'][0]['content']
+            time.sleep(latency)
+            if '"sections"' in prompt:
+                content = _STRUCTURE
+            elif '"weekly_plan"' in prompt:
+                content = _SCHEDULE
+            elif 'importance' in prompt:
+                content = _KEYWORDS
+            else:
+                content = 'A short summary of the course outline.'
+            body = json.dumps({"choices": [{"message": {"content": content}}]}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_api(workers: int, threads: int, upstream: str) -> Tuple[subprocess.Popen, str]:
+    port = free_port()
+    env = dict(
+        os.environ,
+        API_BIND=f'127.0.0.1:{port}',
+        API_WORKERS=str(workers),
+        API_THREADS=str(threads),
+        OPENROUTER_BASE_URL=upstream,
+        OPENROUTER_API_KEY=os.getenv('OPENROUTER_API_KEY', 'benchmark'),
+        ANALYSIS_CACHE_PATH='',
+        # Every request comes from one address: the per-client limit would
+        # turn most of the load into 429s (and persist them for later runs)
+        RATE_LIMIT_REQUESTS='0',
+    )
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            # Any answer (a 404 for an unknown job) means the workers are up
+            requests.get(f'{url}/jobs/ready', timeout=5)
+            return process, url
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError('gunicorn did not start')
+
+
+def load(url: str, pdf: bytes, clients: int, duration: float) -> dict:
+    """Closed-loop load: each client sends its next request when the previous one returns"""
+    timings, errors = [], 0
+    lock = threading.Lock()
+    stop = time.monotonic() + duration
+
+    def client():
+        nonlocal errors
+        with requests.Session() as session:
+            while time.monotonic() < stop:
+                started = time.perf_counter()
+                try:
+                    response = session.post(
+                        f'{url}/upload', files={'file': ('outline.pdf', pdf, 'application/pdf')}, timeout=120
+                    )
+                    ok = response.status_code == 200
+                except requests.RequestException:
+                    ok = False
+                with lock:
+                    if ok:
+                        timings.append(time.perf_counter() - started)
+                    else:
+                        errors += 1
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        for _ in range(clients):
+            pool.submit(client)
+    elapsed = time.monotonic() - started
+    latencies = np.array(timings or [0.0])
+    return {
+        "rps": len(timings) / elapsed,
+        "mean": latencies.mean(),
+        "p95": np.percentile(latencies, 95),
+        "errors": errors,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark API throughput by gunicorn worker count")
+    parser.add_argument("pdf")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--latency", type=float, default=0.5, help="mock upstream seconds per completion")
+    args = parser.parse_args()
+
+    with open(args.pdf, 'rb') as f:
+        pdf = f.read()
+    upstream = mock_upstream(args.latency)
+    upstream_url = f'http://127.0.0.1:{upstream.server_address[1]}'
+
+    print(f"{args.clients} clients, {args.duration:.0f}s per run, upstream latency {args.latency}s")
+    print("workers  threads  req/s   mean s  p95 s  errors")
+    for workers in args.workers:
+        process, url = start_api(workers, args.threads, upstream_url)
+        try:
+            # One request per worker first, so start-up costs are not measured
+            load(url, pdf, workers, 0.1)
+            result = load(url, pdf, args.clients, args.duration)
+        finally:
+            process.terminate()
+            process.wait(timeout=90)
+        print(f"{workers:7d}  {args.threads:7d}  {result['rps']:5.2f}  {result['mean']:7.2f}  "
+              f"{result['p95']:5.2f}  {result['errors']:6d}")
+    upstream.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""Throughput and text quality of each installed PDF extraction backend.
+
+    python benchmarks/bench_backends.py outlines/ --repeat 3 --write
+
+Extracts every PDF in the corpus directory with each backend (in-process,
+one worker) and prints pages/second and a text-quality score (the share
+of word-like tokens, see pdf_backends.text_quality). With --write the
+results and the resulting ranking are saved to PDF_BACKEND_BENCHMARK
+(default .cache/pdf_backends.json), which PDF_BACKEND=auto reads at
+startup to pick the fastest backend whose quality is acceptable.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pdf_backends  # noqa: E402
+from pdf_processor import PDFProcessor  # noqa: E402
+
+
+def load_corpus(directory: str) -> dict:
+    corpus = {}
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith('.pdf'):
+            with open(os.path.join(directory, name), 'rb') as f:
+                corpus[name] = f.read()
+    return corpus
+
+
+def bench(corpus: dict, backend: str, repeat: int) -> dict:
+    """Best-of-repeat pages/second and mean text quality over the corpus"""
+    best, qualities, characters, failures = 0.0, [], 0, []
+    for attempt in range(repeat):
+        pages_done, started = 0, time.perf_counter()
+        for name, data in corpus.items():
+            try:
+                pages = PDFProcessor.extract_pages(data, workers=1, backend=backend)
+            except Exception as e:
+                if attempt == 0:
+                    failures.append(f"{name}: {str(e)}")
+                continue
+            pages_done += len(pages)
+            if attempt == 0:
+                text = "\n".join(pages)
+                characters += len(text)
+                qualities.append(pdf_backends.text_quality(text))
+        best = max(best, pages_done / (time.perf_counter() - started))
+    if not qualities:
+        return {"error": "; ".join(failures) or "no pages extracted"}
+    return {
+        "pages_per_second": round(best, 1),
+        "quality": round(sum(qualities) / len(qualities), 4),
+        "characters": characters,
+        "failures": failures,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark PDF text-extraction backends")
+    parser.add_argument("corpus", help="Directory of sample PDFs")
+    parser.add_argument("--backends", nargs="+", default=None, help="Backends to compare (default: all installed)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--write", action="store_true", help="Save results for automatic backend selection")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    if not corpus:
+        print(f"No PDFs in {args.corpus}", file=sys.stderr)
+        return 1
+    backends = args.backends or pdf_backends.available_backends()
+
+    results = {}
+    print(f"{'backend':>10} {'pages/s':>10} {'quality':>8} {'chars':>10}   ({len(corpus)} documents)")
+    for name in backends:
+        if name not in pdf_backends.BACKENDS or not pdf_backends.BACKENDS[name].available():
+            print(f"{name:>10}  not installed")
+            continue
+        results[name] = bench(corpus, name, args.repeat)
+        result = results[name]
+        if "error" in result:
+            print(f"{name:>10}  failed: {result['error']}")
+            continue
+        print(f"{name:>10} {result['pages_per_second']:>10.1f} {result['quality']:>8.3f} {result['characters']:>10}")
+        for failure in result["failures"]:
+            print(f"{'':>10}  skipped {failure}")
+
+    ranking = pdf_backends.rank_backends(results)
+    print(f"Ranking: {', '.join(ranking) or 'none'}")
+    if args.write and ranking:
+        directory = os.path.dirname(pdf_backends.BENCHMARK_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(pdf_backends.BENCHMARK_PATH, 'w') as f:
+            json.dump({"corpus_documents": len(corpus), "results": results, "ranking": ranking}, f, indent=2)
+        print(f"Wrote {pdf_backends.BENCHMARK_PATH}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+"""Page-extraction throughput versus worker count.
+
+    python benchmarks/bench_extraction.py outline.pdf --workers 1 2 4 8 --repeat 3
+
+Prints pages/second for each worker count so scaling with cores can be
+compared against the single-process baseline.
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import extraction_sandbox  # noqa: E402
+import pdf_processor  # noqa: E402
+from pdf_processor import PDFProcessor  # noqa: E402
+
+
+def bench(data: bytes, workers: int, repeat: int) -> float:
+    """Best-of-repeat pages/second for one worker count"""
+    best = 0.0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        pages = PDFProcessor.extract_pages(data, workers)
+        elapsed = time.perf_counter() - started
+        best = max(best, len(pages) / elapsed)
+    return best
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark parallel PDF page extraction")
+    parser.add_argument("pdf", help="PDF to extract")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with open(args.pdf, 'rb') as f:
+        data = f.read()
+    # Benchmark every document in parallel mode regardless of size
+    pdf_processor.PARALLEL_MIN_PAGES = 0
+
+    print(f"{'workers':>8} {'pages/s':>10} {'speedup':>8}   (cpu_count={os.cpu_count()})")
+    baseline = None
+    for workers in sorted(set(args.workers)):
+        pdf_processor.EXTRACT_WORKERS = workers
+        # Let the one benchmarked document use every worker, not the default half
+        extraction_sandbox.DOCUMENT_WORKERS = workers
+        if pdf_processor._sandbox is not None:
+            pdf_processor._sandbox.shutdown()
+        pdf_processor._sandbox = None
+        bench(data, workers, 1)  # warm up the worker processes
+        rate = bench(data, workers, args.repeat)
+        baseline = baseline or rate
+        print(f"{workers:>8} {rate:>10.1f} {rate / baseline:>7.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
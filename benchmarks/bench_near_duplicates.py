@@ -0,0 +1,63 @@
+"""Lookup latency of the near-duplicate index as it grows.
+
+    python benchmarks/bench_near_duplicates.py --documents 50000 --queries 2000
+
+Fills a throwaway index with random signatures (plus a few near-duplicate
+pairs, so some lookups have candidates to verify) and prints the mean and
+99th-percentile query time and the recall on the planted duplicates.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import near_duplicates  # noqa: E402
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark near-duplicate index lookups")
+    parser.add_argument("--documents", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    random = np.random.RandomState(0)
+    signatures = random.randint(0, 1 << 32, (args.documents, near_duplicates.NUM_PERM), dtype=np.uint64)
+    signatures = signatures.astype(np.uint32)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "index.sqlite3")
+        index = near_duplicates.NearDuplicateIndex(path, max_documents=args.documents)
+        started = time.perf_counter()
+        with index._connect() as conn:
+            conn.executemany(
+                "INSERT INTO signatures (document_hash, signature, created) VALUES (?, ?, ?)",
+                ((f"doc{i}", signature.tobytes(), time.time()) for i, signature in enumerate(signatures))
+            )
+        print(f"Indexed {len(index)} documents in {time.perf_counter() - started:.2f}s")
+
+        # Queries are stored signatures with ~5% of their values changed
+        # (similarity ~0.95), so every one should find its original
+        targets = random.randint(0, args.documents, args.queries)
+        timings, found = [], 0
+        for target in targets:
+            query = signatures[target].copy()
+            changed = random.choice(near_duplicates.NUM_PERM, 3, replace=False)
+            query[changed] = random.randint(0, 1 << 32, 3, dtype=np.uint64).astype(np.uint32)
+            started = time.perf_counter()
+            match = index.query(query)
+            timings.append(time.perf_counter() - started)
+            found += match is not None and match[0] == f"doc{target}"
+
+    timings = np.array(timings) * 1000
+    print(f"query: mean {timings.mean():.3f} ms, p99 {np.percentile(timings, 99):.3f} ms, "
+          f"recall {found / args.queries:.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
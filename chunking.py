@@ -0,0 +1,187 @@
+import re
+from typing import Dict, Iterable, Iterator, List
+
+# Page separator used by PDFProcessor.extract_text and kept by preprocess_text
+PAGE_BREAK = "\f"
+
+_SENTENCE_BOUNDARY = re.compile(r'(?<=[.;:])\s+')
+_WEEK_NUMBER = re.compile(r'\d+')
+_TOKEN_PIECE = re.compile(r'[A-Za-z]{1,5}|\d{1,3}|[^\sA-Za-z\d]')
+
+
+def estimate_tokens(text: str) -> int:
+    """Local approximation of a BPE tokenizer's token count.
+
+    Letter runs count one token per five letters, digit runs one per three
+    digits, and every other non-space character one token, which errs on
+    the high side for English prose and stays safe for symbols and
+    non-Latin scripts (where four characters per token badly undercounts).
+    """
+    return len(_TOKEN_PIECE.findall(text))
+
+
+def split_tokens(text: str, max_tokens: int) -> List[str]:
+    """Hard-split text into consecutive pieces of at most max_tokens each, by estimate_tokens()"""
+    pieces, start = [], 0
+    for count, piece in enumerate(_TOKEN_PIECE.finditer(text), 1):
+        if count % max_tokens == 0:
+            pieces.append(text[start:piece.end()])
+            start = piece.end()
+    if text[start:].strip():
+        pieces.append(text[start:])
+    return pieces
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """The longest prefix of text that estimate_tokens() puts at max_tokens or fewer"""
+    for count, piece in enumerate(_TOKEN_PIECE.finditer(text), 1):
+        if count == max_tokens:
+            return text[:piece.end()]
+    return text
+
+
+def _split_oversized(text: str, max_tokens: int) -> List[str]:
+    """Split a single page that exceeds the budget on sentence boundaries"""
+    pieces, current, current_tokens = [], [], 0
+    for sentence in _SENTENCE_BOUNDARY.split(text):
+        tokens = estimate_tokens(sentence) + 1
+        if current and current_tokens + tokens > max_tokens:
+            pieces.append(" ".join(current))
+            current, current_tokens = [], 0
+        if tokens > max_tokens:
+            # No usable boundary: fall back to a hard split
+            pieces.extend(split_tokens(sentence, max_tokens))
+            continue
+        current.append(sentence)
+        current_tokens += tokens
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def iter_chunks(pages: Iterable[str], max_tokens: int) -> Iterator[str]:
+    """Greedily pack whole pages into chunks of at most max_tokens, lazily.
+
+    Each chunk is yielded as soon as the page that would overflow it
+    arrives, so chunk analysis can start while later pages are still being
+    extracted. Pages are never split unless a single page exceeds the
+    budget, in which case it is broken on sentence boundaries.
+    """
+    current, current_tokens = [], 0
+    for page in pages:
+        page = page.strip()
+        if not page:
+            continue
+        tokens = estimate_tokens(page) + 1
+        if tokens > max_tokens:
+            if current:
+                yield PAGE_BREAK.join(current)
+                current, current_tokens = [], 0
+            yield from _split_oversized(page, max_tokens)
+            continue
+        if current and current_tokens + tokens > max_tokens:
+            yield PAGE_BREAK.join(current)
+            current, current_tokens = [], 0
+        current.append(page)
+        current_tokens += tokens
+    if current:
+        yield PAGE_BREAK.join(current)
+
+
+def split_into_chunks(text: str, max_tokens: int) -> List[str]:
+    """Split PAGE_BREAK-separated text into page-aligned chunks (see iter_chunks)"""
+    return list(iter_chunks(text.split(PAGE_BREAK), max_tokens))
+
+
+def _dedupe(items: List) -> List:
+    seen, result = set(), []
+    for item in items:
+        key = item.strip().lower() if isinstance(item, str) else repr(item)
+        if key not in seen:
+            seen.add(key)
+            result.append(item)
+    return result
+
+
+def merge_structures(parts: List[Dict]) -> Dict:
+    """Merge partial document structures, combining sections with the same title"""
+    sections: Dict[str, Dict] = {}
+    merged = {"sections": [], "learning_objectives": [], "competencies": [], "resources": []}
+    for part in parts:
+        for section in part.get("sections", []):
+            key = str(section.get("title", "")).strip().lower()
+            if key not in sections:
+                sections[key] = {
+                    "title": section.get("title", ""),
+                    "level": section.get("level", 1),
+                    "subsections": []
+                }
+                merged["sections"].append(sections[key])
+            existing = {str(sub.get("title", "")).strip().lower(): sub for sub in sections[key]["subsections"]}
+            for sub in section.get("subsections", []):
+                sub_key = str(sub.get("title", "")).strip().lower()
+                if sub_key in existing:
+                    existing[sub_key]["items"] = _dedupe(existing[sub_key].get("items", []) + sub.get("items", []))
+                else:
+                    copy = {"title": sub.get("title", ""), "items": list(sub.get("items", []))}
+                    sections[key]["subsections"].append(copy)
+                    existing[sub_key] = copy
+        for field in ("learning_objectives", "competencies", "resources"):
+            merged[field].extend(part.get(field, []))
+    for field in ("learning_objectives", "competencies", "resources"):
+        merged[field] = _dedupe(merged[field])
+    return merged
+
+
+def _week_sort_key(week) -> tuple:
+    match = _WEEK_NUMBER.search(str(week))
+    return (0, int(match.group())) if match else (1, str(week))
+
+
+def merge_schedules(parts: List[Dict]) -> Dict:
+    """Merge partial schedules: de-duplicate milestones and combine weeks"""
+    milestones, seen = [], set()
+    weeks: Dict[str, Dict] = {}
+    for part in parts:
+        for milestone in part.get("milestones", []):
+            key = (
+                str(milestone.get("type", "")).lower(),
+                str(milestone.get("description", "")).strip().lower(),
+                str(milestone.get("week", ""))
+            )
+            if key not in seen:
+                seen.add(key)
+                milestones.append(milestone)
+        for week in part.get("weekly_plan", []):
+            key = str(week.get("week", ""))
+            if key in weeks:
+                weeks[key]["activities"] = _dedupe(weeks[key]["activities"] + list(week.get("activities", [])))
+            else:
+                weeks[key] = {
+                    "week": week.get("week", ""),
+                    "topic": week.get("topic", ""),
+                    "activities": list(week.get("activities", []))
+                }
+    return {
+        "milestones": sorted(milestones, key=lambda m: _week_sort_key(m.get("week", ""))),
+        "weekly_plan": sorted(weeks.values(), key=lambda w: _week_sort_key(w["week"]))
+    }
+
+
+def merge_keywords(parts: List[Dict], limit: int = 50) -> Dict:
+    """Merge partial keyword lists, keeping the highest score per word"""
+    scores: Dict[str, Dict] = {}
+    for part in parts:
+        for item in part.get("keywords", []):
+            word = str(item.get("word", "")).strip()
+            if not word:
+                continue
+            try:
+                score = float(item.get("score", 0))
+            except (TypeError, ValueError):
+                continue
+            key = word.lower()
+            if key not in scores or score > scores[key]["score"]:
+                scores[key] = {"word": word, "score": score}
+    ranked = sorted(scores.values(), key=lambda item: item["score"], reverse=True)[:limit]
+    return {"keywords": [{"word": item["word"], "score": round(item["score"])} for item in ranked]}
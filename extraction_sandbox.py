@@ -0,0 +1,226 @@
+import os
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Wall-clock limit for one extraction job (inspecting a document or extracting
+# one of its page ranges), counted from when a worker starts it
+EXTRACT_TIMEOUT = float(os.getenv('PDF_EXTRACT_TIMEOUT', '60'))
+# Workers one document may occupy at once (0: half the pool, at least one),
+# so a large upload cannot hold every worker while other uploads wait
+DOCUMENT_WORKERS = int(os.getenv('PDF_DOCUMENT_WORKERS', '0'))
+# Address-space cap (RLIMIT_AS) for each extraction worker process
+WORKER_MEMORY_MB = int(os.getenv('PDF_WORKER_MEMORY_MB', '1024'))
+# Workers are replaced after this many jobs, bounding leaks and fragmentation
+WORKER_MAX_JOBS = int(os.getenv('PDF_WORKER_MAX_JOBS', '50'))
+
+
+class ExtractionError(Exception):
+    """PDF extraction failed in a sandboxed worker (crash, limit or parse error)"""
+
+
+class ExtractionLimitError(ExtractionError):
+    """The document exceeded a configured extraction limit"""
+
+
+def _apply_limits(memory_mb: int):
+    if resource is None or memory_mb <= 0:
+        return
+    limit = memory_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _worker_main(conn, memory_mb: int):
+    """Worker process loop: run (function, args) jobs until told to stop"""
+    _apply_limits(memory_mb)
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            return
+        if job is None:
+            return
+        function, args = job
+        try:
+            reply = ("ok", function(*args))
+        except ExtractionError as e:
+            reply = ("error", e)
+        except MemoryError:
+            reply = ("error", ExtractionLimitError(
+                f"PDF extraction exceeded the {memory_mb} MB memory limit"
+            ))
+        except Exception as e:
+            reply = ("error", ExtractionError(f"{type(e).__name__}: {str(e)}"))
+        try:
+            conn.send(reply)
+        except Exception as e:
+            # The result itself could not be sent (e.g. too large to allocate)
+            conn.send(("error", ExtractionError(f"Could not return extraction result: {str(e)}")))
+
+
+class _Worker:
+    def __init__(self, context, memory_mb: int):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, memory_mb), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+
+    def stop(self):
+        """Ask the worker to exit, killing it if it does not"""
+        try:
+            self.conn.send(None)
+        except Exception:
+            pass
+        self.process.join(1)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class ExtractionSandbox:
+    """Runs untrusted PDF parsing in resource-limited worker processes.
+
+    Each worker runs with an RLIMIT_AS memory cap and handles one job at a
+    time. A job that overruns its deadline gets its worker killed (other
+    jobs keep their workers), a crashed worker is replaced, and workers are
+    recycled after max_jobs jobs. Idle workers are reused most recently
+    used first, so only as many processes as peak concurrency are started.
+    Job functions must be importable module-level functions.
+    """
+
+    def __init__(
+        self,
+        max_workers: int,
+        memory_mb: int = WORKER_MEMORY_MB,
+        max_jobs: int = WORKER_MAX_JOBS,
+    ):
+        self.max_workers = max(1, max_workers)
+        self.memory_mb = memory_mb
+        self.max_jobs = max_jobs
+        # spawn: never fork a multi-threaded web server process
+        self._context = multiprocessing.get_context('spawn')
+        self._dispatch = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="pdf-sandbox")
+        self._idle: List[_Worker] = []
+        self._lock = threading.Lock()
+
+    def _acquire(self) -> _Worker:
+        with self._lock:
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.process.is_alive():
+                    return worker
+                worker.kill()
+        return _Worker(self._context, self.memory_mb)
+
+    def _release(self, worker: _Worker):
+        if worker.jobs >= self.max_jobs:
+            worker.stop()
+            return
+        with self._lock:
+            self._idle.append(worker)
+
+    def _run(self, function: Callable, args: tuple, timeout: float):
+        worker = self._acquire()
+        try:
+            worker.conn.send((function, args))
+            # The clock starts here, once a worker has the job, not while it queues
+            if not worker.conn.poll(timeout):
+                raise ExtractionLimitError(f"PDF extraction took longer than {timeout:g} seconds")
+            status, payload = worker.conn.recv()
+        except ExtractionError:
+            worker.kill()
+            raise
+        except (EOFError, OSError):
+            worker.kill()
+            raise ExtractionError(
+                f"PDF extraction worker crashed (exit code {worker.process.exitcode}), "
+                "possibly by exceeding its memory limit"
+            )
+        worker.jobs += 1
+        self._release(worker)
+        if status == "error":
+            raise payload
+        return payload
+
+    def submit(self, function: Callable, *args, timeout: Optional[float] = None) -> Future:
+        """Schedule function(*args) in a worker; the future fails with ExtractionError"""
+        return self._dispatch.submit(self._run, function, args, EXTRACT_TIMEOUT if timeout is None else timeout)
+
+    def run(self, function: Callable, *args, timeout: Optional[float] = None):
+        """Run function(*args) in a worker and wait for the result"""
+        return self.submit(function, *args, timeout=timeout).result()
+
+    def document(self, max_workers: Optional[int] = None) -> "DocumentJobs":
+        """Job queue for one document, holding at most max_workers workers at a time"""
+        if max_workers is None:
+            max_workers = DOCUMENT_WORKERS or self.max_workers // 2
+        return DocumentJobs(self, max(1, max_workers))
+
+    def shutdown(self):
+        self._dispatch.shutdown(wait=True, cancel_futures=True)
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.stop()
+
+
+class DocumentJobs:
+    """One document's jobs, handed to the sandbox a few at a time.
+
+    Jobs beyond max_workers wait here, in order, rather than in the
+    sandbox's shared queue, so jobs from other documents are never stuck
+    behind all of this document's page ranges. Cancelling a waiting job's
+    future removes it before it is dispatched.
+    """
+
+    def __init__(self, sandbox: ExtractionSandbox, max_workers: int):
+        self.sandbox = sandbox
+        self.max_workers = max_workers
+        self._pending = deque()
+        self._running = 0
+        self._lock = threading.Lock()
+
+    def submit(self, function: Callable, *args, timeout: Optional[float] = None) -> Future:
+        future = Future()
+        with self._lock:
+            self._pending.append((future, function, args, timeout))
+        self._dispatch()
+        return future
+
+    def run(self, function: Callable, *args, timeout: Optional[float] = None):
+        return self.submit(function, *args, timeout=timeout).result()
+
+    def _dispatch(self):
+        while True:
+            with self._lock:
+                if self._running >= self.max_workers or not self._pending:
+                    return
+                future, function, args, timeout = self._pending.popleft()
+                if not future.set_running_or_notify_cancel():
+                    continue
+                self._running += 1
+            inner = self.sandbox.submit(function, *args, timeout=timeout)
+            inner.add_done_callback(lambda done, future=future: self._finished(future, done))
+
+    def _finished(self, future: Future, done: Future):
+        with self._lock:
+            self._running -= 1
+        if done.cancelled():
+            future.set_exception(ExtractionError("PDF extraction was cancelled"))
+        elif done.exception() is not None:
+            future.set_exception(done.exception())
+        else:
+            future.set_result(done.result())
+        self._dispatch()
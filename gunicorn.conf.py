@@ -0,0 +1,49 @@
+"""Gunicorn settings for the Flask JSON API (app.py).
+
+    gunicorn -c gunicorn.conf.py app:app
+
+Pre-forks API_WORKERS processes with API_THREADS threads each, so up to
+workers x threads requests are served at once; further connections wait
+in the listen backlog. Workers share the analysis cache and the job
+store through SQLite. On SIGTERM (or when a worker is recycled after
+max_requests), a worker stops accepting requests and gets
+graceful_timeout seconds to finish its in-flight requests and
+background jobs before it is killed.
+
+Every worker also runs its own PDF extraction sandbox. Unless
+PDF_EXTRACT_WORKERS is set, the host's CPUs are shared out between the
+workers (at least one extraction process each), so extraction stays
+bounded at about max(CPUs, workers) processes of PDF_WORKER_MEMORY_MB
+however many workers there are.
+"""
+import os
+import multiprocessing
+
+from dotenv import load_dotenv
+
+load_dotenv()  # The settings below may come from .env, as the app's do
+
+bind = os.getenv('API_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('API_WORKERS') or multiprocessing.cpu_count() * 2 + 1)
+# Threads keep a worker responsive while its requests wait on the upstream API
+worker_class = 'gthread'
+threads = int(os.getenv('API_THREADS', '4'))
+if not os.getenv('PDF_EXTRACT_WORKERS'):
+    # Read by pdf_processor when each worker imports the app (the workers
+    # inherit this process's environment)
+    os.environ['PDF_EXTRACT_WORKERS'] = str(max(1, multiprocessing.cpu_count() // workers))
+backlog = int(os.getenv('API_BACKLOG', '64'))
+timeout = int(os.getenv('API_TIMEOUT', '180'))
+graceful_timeout = int(os.getenv('API_GRACEFUL_TIMEOUT', '60'))
+keepalive = 5
+# Recycle workers now and then to cap slow leaks; jitter staggers the restarts
+max_requests = int(os.getenv('API_MAX_REQUESTS', '1000'))
+max_requests_jitter = max_requests // 10
+accesslog = '-'
+errorlog = '-'
+
+
+def worker_exit(server, worker):
+    """Let the exiting worker's queued and running jobs finish (bounded by graceful_timeout)"""
+    import app
+    app.shutdown(wait=True)
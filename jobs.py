@@ -0,0 +1,203 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import sqlite3
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional
+
+# Background workers per server process; each runs one job at a time
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '4'))
+# Jobs accepted but not yet finished, per process, before POST /jobs returns 503
+JOB_QUEUE_LIMIT = int(os.getenv('JOB_QUEUE_LIMIT', '32'))
+# Finished jobs are kept this long (seconds) for GET /jobs/<id>
+JOB_TTL = int(os.getenv('JOB_TTL', '3600'))
+# Job states live here so every server process can report on every job
+JOB_STORE_PATH = os.getenv('JOB_STORE_PATH', '.cache/jobs.sqlite3')
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+
+class JobStore:
+    """Job states as JSON rows in SQLite.
+
+    The job runs in the process that accepted it, but its state is shared
+    through the database, so any server process (or replica on the same
+    volume) can answer GET /jobs/<id>. Jobs expire ttl_seconds after their
+    last update.
+    """
+
+    def __init__(self, path: str, ttl_seconds: int = JOB_TTL):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY,"
+                " state TEXT NOT NULL,"
+                " updated REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def save(self, job_id: str, state: Dict) -> None:
+        try:
+            now = time.time()
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO jobs (id, state, updated) VALUES (?, ?, ?)",
+                    (job_id, json.dumps(state), now)
+                )
+                conn.execute("DELETE FROM jobs WHERE updated < ?", (now - self.ttl_seconds,))
+        except Exception as e:
+            logging.error(f"Job store write error: {str(e)}")
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT state FROM jobs WHERE id = ? AND updated >= ?", (job_id, time.time() - self.ttl_seconds)
+                ).fetchone()
+            return json.loads(row[0]) if row is not None else None
+        except Exception as e:
+            logging.error(f"Job store read error: {str(e)}")
+            return None
+
+
+class Job:
+    """One upload's progress: overall status, per-stage status and partial results.
+
+    Updates may come from several analysis threads at once; every update
+    is written through to the store.
+    """
+
+    def __init__(self, job_id: str, stages: Iterable[str], store: JobStore):
+        self.id = job_id
+        self._store = store
+        self._lock = threading.Lock()
+        now = time.time()
+        self._state = {
+            "id": job_id,
+            "status": STATUS_QUEUED,
+            "stages": {stage: {"status": "pending"} for stage in stages},
+            "results": {},
+            "error": None,
+            "created": now,
+            "updated": now,
+        }
+        self._save()
+
+    def _save(self):
+        self._state["updated"] = time.time()
+        self._store.save(self.id, self._state)
+
+    def update(self, stage: Optional[str] = None, status: Optional[str] = None, results: Optional[Dict] = None, **fields):
+        """Set a stage's status (and extra fields such as a page count) and merge partial results"""
+        with self._lock:
+            if stage is not None:
+                entry = self._state["stages"].setdefault(stage, {})
+                if status is not None:
+                    entry["status"] = status
+                entry.update(fields)
+            if results:
+                self._state["results"].update(results)
+            self._save()
+
+    def finish(self, status: str, error: Optional[str] = None):
+        with self._lock:
+            self._state["status"] = status
+            self._state["error"] = error
+            self._save()
+
+    def start(self):
+        with self._lock:
+            self._state["status"] = STATUS_RUNNING
+            self._save()
+
+
+class JobManager:
+    """Accepts uploads as jobs and runs them on a bounded pool of background threads.
+
+    runner(job, path) does the work for one job, reporting progress
+    through job.update(); the upload is spooled to a temp file at path,
+    which is removed when the job ends. At most queue_limit jobs are
+    queued or running in this process; submit() returns None beyond that.
+    """
+
+    def __init__(
+        self,
+        runner: Callable[[Job, str], None],
+        stages: Iterable[str],
+        store: JobStore,
+        workers: int = JOB_WORKERS,
+        queue_limit: int = JOB_QUEUE_LIMIT,
+    ):
+        self.runner = runner
+        self.stages = list(stages)
+        self.store = store
+        self.queue_limit = queue_limit
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="job")
+        self._active = 0
+        self._lock = threading.Lock()
+
+    def submit(self, upload) -> Optional[str]:
+        """Spool an upload (file object or Werkzeug FileStorage) and queue it; returns the job id"""
+        with self._lock:
+            if self._active >= self.queue_limit:
+                return None
+            self._active += 1
+        spool = None
+        try:
+            stream = getattr(upload, 'stream', upload)
+            stream.seek(0)
+            spool = tempfile.NamedTemporaryFile(suffix='.pdf', delete=False)
+            with spool:
+                shutil.copyfileobj(stream, spool, 1024 * 1024)
+            job = Job(uuid.uuid4().hex, self.stages, self.store)
+            self._executor.submit(self._run, job, spool.name)
+            return job.id
+        except Exception:
+            # Nothing will run the job, so nothing else removes its spool file
+            if spool is not None:
+                os.unlink(spool.name)
+            with self._lock:
+                self._active -= 1
+            raise
+
+    def _run(self, job: Job, path: str):
+        try:
+            job.start()
+            self.runner(job, path)
+            job.finish(STATUS_DONE)
+        except Exception as e:
+            logging.error(f"Job {job.id} failed: {str(e)}")
+            job.finish(STATUS_FAILED, str(e))
+        finally:
+            os.unlink(path)
+            with self._lock:
+                self._active -= 1
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        return self.store.get(job_id)
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
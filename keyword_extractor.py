@@ -0,0 +1,183 @@
+import os
+import re
+import sys
+import json
+import logging
+import argparse
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from chunking import PAGE_BREAK
+
+# General English stop words plus the boilerplate vocabulary every course
+# outline shares, which would otherwise dominate the keyword ranking.
+STOP_WORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below
+between both but by can could did do does doing down during each either etc few for from further had has
+have having he her here hers him his how however i if in into is it its itself just may me might more most
+must my no nor not now of off on once only or other our ours out over own per same she should so some such
+than that the their theirs them then there these they this those through to too under until up upon us
+very via was we were what when where which while who whom why will with within without would you your
+academic academy activities activity assessment assessments available based class classes course courses
+credit credits date dates due email faculty following grade grades hour hours include includes including
+information instructor instructors learn learning lecture lectures lesson lessons management mark marks
+module modules note page pages percent please policies policy provide provided required requirement
+requirements school section sections semester session sessions singapore smu student students study
+submission submissions teaching term terms topic topics total understand university use used using week
+weeks weekly work year years
+""".split())
+
+DEFAULT_IDF_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets', 'syllabus_idf.json')
+# Built with `python keyword_extractor.py <directory of outline PDFs>`; without
+# it, IDF comes from the document's own pages and boilerplate ranks high
+IDF_PATH = os.getenv('KEYWORD_IDF_PATH', DEFAULT_IDF_PATH)
+
+_TOKEN = re.compile(r"[a-z][a-z0-9+#\-]*[a-z0-9+#]|[a-z]")
+_PHRASE_BREAK = re.compile(r"[.,;:()!?\f\n]")
+_MAX_PHRASE_WORDS = 3
+
+
+@lru_cache(maxsize=4)
+def load_idf_table(path: str = DEFAULT_IDF_PATH) -> Optional[Dict]:
+    """Load an IDF table built by build_idf_table(), or None if there isn't one"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logging.error(f"Could not load IDF table {path}: {str(e)}")
+        return None
+
+
+def _phrases(text: str) -> List[List[str]]:
+    """RAKE candidate phrases: runs of up to three non-stop words"""
+    phrases = []
+    for fragment in _PHRASE_BREAK.split(text.lower()):
+        current = []
+        for token in _TOKEN.findall(fragment):
+            if token in STOP_WORDS or len(token) < 3 or token.isdigit():
+                if current:
+                    phrases.append(current)
+                current = []
+                continue
+            current.append(token)
+            if len(current) == _MAX_PHRASE_WORDS:
+                phrases.append(current)
+                current = []
+        if current:
+            phrases.append(current)
+    return phrases
+
+
+def _document_frequencies(documents: Iterable[str]) -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    for document in documents:
+        for word in {word for phrase in _phrases(document) for word in phrase}:
+            counts[word] = counts.get(word, 0) + 1
+    return counts
+
+
+def build_idf_table(documents: List[str]) -> Dict:
+    """Smoothed IDF over a corpus of preprocessed syllabus texts"""
+    counts = _document_frequencies(documents)
+    n = len(documents)
+    return {
+        "documents": n,
+        "idf": {word: round(float(np.log((1 + n) / (1 + df)) + 1), 4) for word, df in counts.items()}
+    }
+
+
+def _idf_vector(vocabulary: List[str], text: str, table: Optional[Dict]) -> np.ndarray:
+    """IDF per vocabulary word from the corpus table, or from the document's own pages"""
+    if table:
+        n = table["documents"]
+        unseen = float(np.log(1 + n) + 1)
+        idf = table["idf"]
+        return np.array([idf.get(word, unseen) for word in vocabulary], dtype=np.float64)
+    pages = [page for page in text.split(PAGE_BREAK) if page.strip()]
+    counts = _document_frequencies(pages)
+    df = np.array([counts.get(word, 0) for word in vocabulary], dtype=np.float64)
+    return np.log((1 + len(pages)) / (1 + df)) + 1
+
+
+def extract_keywords(text: str, limit: int = 40, idf_table: Optional[Dict] = None) -> Dict:
+    """Rank keywords locally and return {"keywords": [{"word", "score"}]} with scores 1-100.
+
+    Candidate phrases are scored RAKE-style (word degree / frequency) and
+    weighted by TF-IDF, all as vectorised NumPy operations over word ids.
+    """
+    phrases = _phrases(text)
+    if not phrases:
+        return {"keywords": []}
+    if idf_table is None:
+        idf_table = load_idf_table(IDF_PATH)
+
+    vocabulary: Dict[str, int] = {}
+    matrix = np.full((len(phrases), _MAX_PHRASE_WORDS), -1, dtype=np.int64)
+    for row, phrase in enumerate(phrases):
+        for column, word in enumerate(phrase):
+            matrix[row, column] = vocabulary.setdefault(word, len(vocabulary))
+
+    words = list(vocabulary)
+    mask = matrix >= 0
+    ids = matrix[mask]
+    lengths = mask.sum(axis=1)
+
+    # RAKE word score: degree / frequency
+    frequency = np.bincount(ids, minlength=len(words)).astype(np.float64)
+    degree = np.bincount(ids, weights=np.repeat(lengths, lengths), minlength=len(words))
+    tfidf = frequency / frequency.sum() * _idf_vector(words, text, idf_table)
+    word_scores = degree / frequency * tfidf
+
+    # Phrase score: sum of its word scores, boosted by how often it recurs
+    keys = [" ".join(phrase) for phrase in phrases]
+    unique_keys, first_index, occurrences = np.unique(keys, return_index=True, return_counts=True)
+    padded = np.where(mask, word_scores[np.where(mask, matrix, 0)], 0.0)
+    phrase_scores = padded.sum(axis=1)[first_index] * np.log1p(occurrences)
+
+    top = np.argsort(phrase_scores)[::-1][:limit]
+    scores = phrase_scores[top]
+    low, high = scores.min(), scores.max()
+    normalised = np.full(len(top), 100.0) if high == low else 1 + 99 * (scores - low) / (high - low)
+    return {
+        "keywords": [
+            {"word": str(unique_keys[i]).title(), "score": int(round(score))}
+            for i, score in zip(top, normalised)
+        ]
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Build the IDF table from a directory of course-outline PDFs"""
+    from pdf_processor import PDFProcessor
+    from openrouter_client import OpenRouterClient
+
+    parser = argparse.ArgumentParser(description="Build the syllabus IDF table for local keyword extraction")
+    parser.add_argument("directory", help="Directory of course-outline PDFs")
+    parser.add_argument("--output", default=IDF_PATH, help="Where to write the IDF table")
+    args = parser.parse_args(argv)
+
+    documents = []
+    for name in sorted(os.listdir(args.directory)):
+        if not name.lower().endswith('.pdf'):
+            continue
+        try:
+            with open(os.path.join(args.directory, name), 'rb') as f:
+                documents.append(OpenRouterClient.preprocess_text(PDFProcessor.extract_text(f)))
+        except Exception as e:
+            print(f"Skipping {name}: {str(e)}", file=sys.stderr)
+
+    if not documents:
+        print("No PDFs could be read", file=sys.stderr)
+        return 1
+    with open(args.output, 'w') as f:
+        json.dump(build_idf_table(documents), f)
+    print(f"Wrote IDF table for {len(documents)} documents to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,74 +5,219 @@ from pdf_processor import PDFProcessor
 from openrouter_client import OpenRouterClient
 from visualization_handler import VisualizationHandler
 from utils import validate_pdf_file, sanitize_text
-from time import sleep
+from analysis_cache import file_sha256
+from rate_limiter import get_rate_limiter
+from collections import OrderedDict
+import progress
+import threading
+import logging
+import queue
+import time
+import uuid
 import os
 
 load_dotenv()  # Load environment variables from .env file
 
+# Finished analyses are memoized on (file hash, model) so reruns triggered by
+# widgets (copy, download, model switch and back) do not analyse again: a
+# few per session, and a bounded number shared by all sessions of the process
+SESSION_RESULTS_SIZE = 4
+SHARED_RESULTS_SIZE = int(os.getenv('STREAMLIT_RESULTS_MEMO_SIZE', '64'))
+# Share of the progress bar for text extraction; the analyses fill the rest
+EXTRACT_PROGRESS = 30
+
+
+class ResultsMemo:
+    """Thread-safe LRU mapping of (file hash, model) to finished analyses"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+@st.cache_resource
+def get_shared_results() -> ResultsMemo:
+    return ResultsMemo(SHARED_RESULTS_SIZE)
+
+
+def get_session_results() -> ResultsMemo:
+    if 'results' not in st.session_state:
+        st.session_state.results = ResultsMemo(SESSION_RESULTS_SIZE)
+    return st.session_state.results
+
+
+# Long-lived resources, created once per process rather than on every rerun.
+# Clients share the pooled HTTP transport and the analysis cache.
+@st.cache_resource
+def get_pdf_processor() -> PDFProcessor:
+    return PDFProcessor()
+
+
+@st.cache_resource
+def get_openrouter_client(api_key: str, model: str) -> OpenRouterClient:
+    return OpenRouterClient(api_key=api_key, model=model)
+
+
+@st.cache_resource
+def get_viz_handler() -> VisualizationHandler:
+    return VisualizationHandler()
+
+def client_key() -> str:
+    """Rate-limit key: the client address forwarded by nginx, else this session"""
+    address = st.context.headers.get('X-Real-IP') or getattr(st.context, 'ip_address', None)
+    if address:
+        return f"ip:{address}"
+    if 'client_id' not in st.session_state:
+        st.session_state.client_id = uuid.uuid4().hex
+    return f"session:{st.session_state.client_id}"
+
 def load_css():
     with open("assets/style.css") as f:
         st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
 
-def show_progress_bar(text="Processing"):
-    """Shows a progress bar with custom text"""
+def process_pdf_with_progress(
+    uploaded_file, pdf_processor, openrouter_client, viz_handler, summary_placeholder=None, document_hash=None
+):
+    """Process PDF with detailed progress updates.
+
+    When summary_placeholder is given, the summary is streamed into it while
+    the other analyses run in the background. The progress bar and status
+    line follow the pipeline's progress events (see progress): pages
+    extracted, then analyses started and finished and summary tokens
+    streamed.
+    """
     progress_bar = st.progress(0)
-    status_text = st.empty()
-    for i in range(100):
-        progress_bar.progress(i + 1)
-        status_text.text(f"{text}: {i+1}%")
-        sleep(0.01)
-    progress_bar.empty()
-    status_text.empty()
-
-def process_pdf_with_progress(uploaded_file, pdf_processor, openrouter_client, viz_handler):
-    """Process PDF with detailed progress updates"""
-    progress = st.progress(0)
     status = st.empty()
-    
+    started = time.monotonic()
+
+    def show_extraction(event):
+        # Called from this (the script) thread as each page is extracted
+        progress_bar.progress(EXTRACT_PROGRESS * event["pages"] // max(event["total"], 1))
+        source = " (cached)" if event.get("cached") else ""
+        status.text(
+            f"📄 Extracted page {event['pages']}/{event['total']}{source} ({time.monotonic() - started:.1f}s)"
+        )
+
     try:
-        # Extract text
+        # Extract text (reused from the cache for previously seen uploads)
         status.text("📄 Extracting text from PDF...")
-        progress.progress(10)
-        raw_text = pdf_processor.extract_text(uploaded_file)
-        
-        # Preprocess text
-        status.text("🔍 Preprocessing text...")
-        progress.progress(20)
+        document_hash = document_hash or file_sha256(uploaded_file)
+        raw_text = pdf_processor.extract_text_cached(
+            uploaded_file, document_hash, openrouter_client.cache, on_event=show_extraction
+        )
         processed_text = openrouter_client.preprocess_text(raw_text)
-        
-        # Analyze document structure
-        status.text("📊 Analyzing document structure...")
-        progress.progress(35)
-        structure_data = openrouter_client.analyze_document_structure(processed_text)
-        
-        # Generate word cloud
-        status.text("☁️ Generating word cloud...")
-        progress.progress(50)
-        word_cloud_data = openrouter_client.generate_word_cloud_data(processed_text)
-        
-        # Extract schedule
-        status.text("📅 Extracting schedule information...")
-        progress.progress(65)
-        schedule_data = openrouter_client.extract_schedule(processed_text)
-        
-        # Generate summary
-        status.text("📝 Generating summary...")
-        progress.progress(80)
-        summary_data = openrouter_client.summarize_text(processed_text)
-        
-        # Final processing
-        status.text("✨ Finalizing analysis...")
-        progress.progress(100)
-        sleep(0.5)
-        
-        progress.empty()
+        progress_bar.progress(EXTRACT_PROGRESS)
+
+        # Run the analyses, updating as each one starts and finishes
+        status.text("🤖 Running analyses...")
+        labels = {
+            "structure": "📊 Document structure",
+            "word_cloud": "☁️ Word cloud",
+            "schedule": "📅 Schedule",
+            "summary": "📝 Summary"
+        }
+        stream = summary_placeholder is not None and not openrouter_client.combined_analysis
+        analyses = [name for name in labels if not (stream and name == "summary")]
+        results = {}
+        events = queue.Queue()
+
+        def on_event(event):
+            events.put(("event", None, event))
+
+        def run_analyses():
+            try:
+                openrouter_client.analyze_all(
+                    processed_text,
+                    on_result=lambda name, result: events.put(("result", name, result)),
+                    document_hash=document_hash,
+                    analyses=analyses,
+                    on_event=on_event
+                )
+            except Exception as e:
+                for name in analyses:
+                    events.put(("result", name, {"error": str(e)}))
+            finally:
+                events.put(("done", None, None))
+
+        def run_summary_stream():
+            parts = []
+            try:
+                for token in openrouter_client.stream_summary(
+                    processed_text, document_hash=document_hash, on_event=on_event
+                ):
+                    parts.append(token)
+                    events.put(("token", None, token))
+                summary = {"Summary": "".join(parts)} if parts else {"error": "Empty summary stream"}
+            except Exception as e:
+                logging.error(f"Summary stream error: {str(e)}")
+                summary = {"error": str(e)}
+            events.put(("result", "summary", summary))
+            events.put(("done", None, None))
+
+        # Streamlit elements may only be updated from the script thread, so the
+        # workers post events to a queue and this loop renders them.
+        workers = [threading.Thread(target=run_analyses, daemon=True)]
+        if stream:
+            workers.append(threading.Thread(target=run_summary_stream, daemon=True))
+        for worker in workers:
+            worker.start()
+
+        summary_parts = []
+        running = {}
+        pending = len(workers)
+        while pending:
+            kind, name, payload = events.get()
+            if kind == "done":
+                pending -= 1
+            elif kind == "token":
+                summary_parts.append(payload)
+                summary_placeholder.markdown("".join(summary_parts) + "▌")
+            elif kind == "result":
+                results[name] = payload
+                progress_bar.progress(
+                    EXTRACT_PROGRESS + (100 - EXTRACT_PROGRESS) * len(results) // len(labels)
+                )
+            elif payload["event"] == progress.ANALYSIS_STARTED:
+                running[payload["name"]] = labels[payload["name"]]
+                status.text(f"🤖 Running: {', '.join(running.values())}")
+            elif payload["event"] == progress.TOKENS_STREAMED:
+                status.text(f"{labels['summary']}: {payload['tokens']} tokens streamed")
+            elif payload["event"] == progress.ANALYSIS_FINISHED:
+                running.pop(payload["name"], None)
+                timing = "from cache" if payload["cached"] else f"in {payload['seconds']:.1f}s"
+                status.text(
+                    f"{labels[payload['name']]} {payload['status']} {timing} "
+                    f"({len(results) + 1}/{len(labels)})"
+                )
+
+        structure_data = results['structure']
+        word_cloud_data = results['word_cloud']
+        schedule_data = results['schedule']
+        summary_data = results['summary']
+
+        progress_bar.empty()
         status.empty()
-        
+        logging.info(f"Processed {document_hash[:12]} in {time.monotonic() - started:.2f}s")
+
         return structure_data, word_cloud_data, schedule_data, summary_data
         
     except Exception as e:
-        progress.empty()
+        progress_bar.empty()
         status.error(f"Error: {str(e)}")
         raise e
 
@@ -138,14 +283,6 @@ def main():
         </div>
         """, unsafe_allow_html=True)
     
-    # Add rate limiting per session
-    if 'request_count' not in st.session_state:
-        st.session_state.request_count = 0
-    
-    if st.session_state.request_count >= 10:
-        st.error("⚠️ Request limit reached. Please try again later.")
-        st.stop()
-    
     uploaded_file = st.file_uploader("Upload your academic PDF", type="pdf")
     
     if uploaded_file is not None:
@@ -154,59 +291,81 @@ def main():
             return
             
         try:
-            # Initialize components with selected model
-            pdf_processor = PDFProcessor()
-            openrouter_client = OpenRouterClient(
-                api_key=api_key,
-                model=model_options[selected_model]
-            )
-            viz_handler = VisualizationHandler()
-
-            # Process PDF with progress updates
-            with st.spinner("Processing PDF..."):
-                structure_data, word_cloud_data, schedule_data, summary_data = process_pdf_with_progress(
-                    uploaded_file, pdf_processor, openrouter_client, viz_handler
-                )
-            
-            # Create tabs
-            tab1, tab2, tab3 = st.tabs([
-                "📊 Document Structure", 
-                "☁️ Word Cloud",
-                "📅 Schedule Timeline"
-            ])
-
-            with tab1:
-                if 'error' not in structure_data:
-                    st.plotly_chart(
-                        viz_handler.create_document_structure_visualization(structure_data),
-                        use_container_width=True
-                    )
-                else:
-                    st.error("Could not analyze document structure")
-
-            with tab2:
-                if 'error' not in word_cloud_data:
-                    st.plotly_chart(
-                        viz_handler.create_word_cloud_visualization(word_cloud_data),
-                        use_container_width=True
-                    )
-                else:
-                    st.error("Could not generate word cloud")
-
-            with tab3:
-                if 'error' not in schedule_data:
-                    st.plotly_chart(
-                        viz_handler.create_schedule_timeline(schedule_data),
-                        use_container_width=True
+            # Shared components (the client is per model)
+            model = model_options[selected_model]
+            pdf_processor = get_pdf_processor()
+            openrouter_client = get_openrouter_client(api_key, model)
+            viz_handler = get_viz_handler()
+
+            # Tabs are filled in once the analyses finish; the summary below
+            # them streams in as it is generated.
+            tabs_area = st.container()
+            st.subheader("📝 Document Summary")
+            summary_placeholder = st.empty()
+
+            # Reuse this upload's results from an earlier run (this session's
+            # first, then any session's); otherwise process it with progress
+            document_hash = file_sha256(uploaded_file)
+            key = (document_hash, model)
+            results = get_session_results().get(key) or get_shared_results().get(key)
+            if results is None:
+                # Only new analyses count against the limit (shared with the API)
+                allowed, retry_after = get_rate_limiter().hit(client_key())
+                if not allowed:
+                    st.error(f"⚠️ Request limit reached. Please try again in {int(retry_after // 60) + 1} minutes.")
+                    st.stop()
+                with st.spinner("Processing PDF..."):
+                    results = process_pdf_with_progress(
+                        uploaded_file, pdf_processor, openrouter_client, viz_handler, summary_placeholder,
+                        document_hash=document_hash
                     )
-                else:
-                    st.error("Could not extract schedule information")
+                # Failed analyses are not memoized, so the next run retries them
+                if not any(isinstance(result, dict) and 'error' in result for result in results):
+                    get_shared_results().set(key, results)
+                    get_session_results().set(key, results)
+            else:
+                get_session_results().set(key, results)
+            structure_data, word_cloud_data, schedule_data, summary_data = results
+            
+            with tabs_area:
+                # Create tabs
+                tab1, tab2, tab3 = st.tabs([
+                    "📊 Document Structure", 
+                    "☁️ Word Cloud",
+                    "📅 Schedule Timeline"
+                ])
+
+                with tab1:
+                    if 'error' not in structure_data:
+                        st.plotly_chart(
+                            viz_handler.create_document_structure_visualization(structure_data),
+                            use_container_width=True
+                        )
+                    else:
+                        st.error("Could not analyze document structure")
+
+                with tab2:
+                    if 'error' not in word_cloud_data:
+                        st.plotly_chart(
+                            viz_handler.create_word_cloud_visualization(word_cloud_data),
+                            use_container_width=True
+                        )
+                    else:
+                        st.error("Could not generate word cloud")
+
+                with tab3:
+                    if 'error' not in schedule_data:
+                        st.plotly_chart(
+                            viz_handler.create_schedule_timeline(schedule_data),
+                            use_container_width=True
+                        )
+                    else:
+                        st.error("Could not extract schedule information")
 
             # Summary section
-            st.subheader("📝 Document Summary")
             if isinstance(summary_data, dict) and 'Summary' in summary_data:
                 summary_text = summary_data['Summary']
-                st.markdown(summary_text)
+                summary_placeholder.markdown(summary_text)
                 
                 col1, col2 = st.columns(2)
                 with col1:
@@ -220,6 +379,8 @@ def main():
                 with col2:
                     if st.button("📋 Copy to Clipboard"):
                         st.code(summary_text)  # Display in a copyable code block
+            else:
+                summary_placeholder.error("Could not generate summary")
             
         except Exception as e:
             st.error(f"An error occurred: {str(e)}")
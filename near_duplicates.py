@@ -0,0 +1,200 @@
+import os
+import re
+import time
+import zlib
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Serve cached analyses of a near-duplicate document (another section's copy
+# of the same outline, a re-export from Word, ...) when exact hashes differ
+NEAR_DUPLICATE_REUSE = os.getenv('NEAR_DUPLICATE_REUSE', 'true').lower() in ('1', 'true', 'yes')
+# Estimated Jaccard similarity of word 5-gram shingles needed for reuse
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv('NEAR_DUPLICATE_THRESHOLD', '0.9'))
+# Oldest signatures are dropped beyond this many documents
+NEAR_DUPLICATE_MAX_DOCUMENTS = int(os.getenv('NEAR_DUPLICATE_MAX_DOCUMENTS', '50000'))
+
+# MinHash signature of NUM_PERM 32-bit values, split into BANDS bands of ROWS
+# values for LSH. Documents sharing any band are candidates: with 8 x 8, a
+# pair at similarity 0.9 is found 99% of the time, one at 0.5 under 4%.
+NUM_PERM = 64
+BANDS = 8
+ROWS = NUM_PERM // BANDS
+SHINGLE_WORDS = 5
+# Seconds between checks for signatures added by other processes
+SYNC_INTERVAL = 1.0
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+# Fixed seed: signatures must be comparable across processes and restarts
+_random = np.random.RandomState(20240917)
+_PERM_A = _random.randint(1, 1 << 32, NUM_PERM, dtype=np.uint64)
+_PERM_B = _random.randint(0, 1 << 32, NUM_PERM, dtype=np.uint64)
+_WORD = re.compile(r'\w+')
+_BLOCK = 4096  # shingles hashed per numpy block, bounding temporary memory
+
+
+def minhash_signature(text: str) -> np.ndarray:
+    """MinHash signature (NUM_PERM uint32 values) of a text's word 5-gram shingles"""
+    words = _WORD.findall(text.lower())
+    shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(max(len(words) - SHINGLE_WORDS + 1, 1))}
+    hashes = np.fromiter((zlib.crc32(s.encode()) for s in shingles), dtype=np.uint64, count=len(shingles))
+    signature = np.full(NUM_PERM, _MAX_HASH, dtype=np.uint64)
+    for start in range(0, len(hashes), _BLOCK):
+        block = hashes[start:start + _BLOCK, None]
+        # a * h + b stays below 2**64 for 32-bit a, b and h
+        permuted = ((block * _PERM_A + _PERM_B) % np.uint64(_MERSENNE_PRIME)) & _MAX_HASH
+        np.minimum(signature, permuted.min(axis=0), out=signature)
+    return signature.astype(np.uint32)
+
+
+def similarity(first: np.ndarray, second: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    return float(np.count_nonzero(first == second)) / NUM_PERM
+
+
+class NearDuplicateIndex:
+    """MinHash signatures of analysed documents with an in-memory LSH lookup.
+
+    Signatures are stored in a table of the analysis cache's SQLite file,
+    so replicas sharing the cache volume share the index; each process
+    keeps the band buckets in memory and picks up other processes'
+    additions at most SYNC_INTERVAL seconds late. A lookup hashes BANDS
+    band keys and compares only the documents in matching buckets, so its
+    cost does not grow with the number of stored documents.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        threshold: float = NEAR_DUPLICATE_THRESHOLD,
+        max_documents: int = NEAR_DUPLICATE_MAX_DOCUMENTS,
+    ):
+        self.path = path
+        self.threshold = threshold
+        self.max_documents = max_documents
+        self._signatures: Dict[int, Tuple[str, np.ndarray]] = {}
+        self._buckets: List[Dict[int, List[int]]] = [{} for _ in range(BANDS)]
+        self._last_id = 0
+        self._synced = 0.0
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS signatures ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " document_hash TEXT UNIQUE NOT NULL,"
+                " signature BLOB NOT NULL,"
+                " created REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _band_keys(signature: np.ndarray) -> List[int]:
+        # Python's (per-process) hash is fine: buckets never leave the process
+        return [hash(signature[band * ROWS:(band + 1) * ROWS].tobytes()) for band in range(BANDS)]
+
+    def _remember(self, row_id: int, document_hash: str, signature: np.ndarray):
+        self._signatures[row_id] = (document_hash, signature)
+        for band, key in enumerate(self._band_keys(signature)):
+            self._buckets[band].setdefault(key, []).append(row_id)
+
+    def _forget(self, row_id: int):
+        _, signature = self._signatures.pop(row_id)
+        for band, key in enumerate(self._band_keys(signature)):
+            bucket = self._buckets[band].get(key, [])
+            if row_id in bucket:
+                bucket.remove(row_id)
+            if not bucket:
+                self._buckets[band].pop(key, None)
+
+    def _sync(self, force: bool = False):
+        """Load signatures added since the last sync (by any process); caller holds the lock"""
+        now = time.monotonic()
+        if not force and now - self._synced < SYNC_INTERVAL:
+            return
+        self._synced = now
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, document_hash, signature FROM signatures WHERE id > ? ORDER BY id", (self._last_id,)
+            ).fetchall()
+            oldest = conn.execute("SELECT MIN(id) FROM signatures").fetchone()[0]
+        for row_id, document_hash, blob in rows:
+            self._remember(row_id, document_hash, np.frombuffer(blob, dtype=np.uint32))
+            self._last_id = row_id
+        # Drop signatures pruned from the table (remembered in id order, so they come first)
+        while oldest is not None and self._signatures and next(iter(self._signatures)) < oldest:
+            self._forget(next(iter(self._signatures)))
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._sync()
+            return len(self._signatures)
+
+    def query(self, signature: np.ndarray, exclude: Optional[str] = None) -> Optional[Tuple[str, float]]:
+        """The most similar stored document at or above the threshold, as (document_hash, similarity)"""
+        try:
+            with self._lock:
+                self._sync()
+                candidates = set()
+                for band, key in enumerate(self._band_keys(signature)):
+                    candidates.update(self._buckets[band].get(key, ()))
+                best = None
+                for row_id in candidates:
+                    document_hash, stored = self._signatures[row_id]
+                    if document_hash == exclude:
+                        continue
+                    score = similarity(signature, stored)
+                    if score >= self.threshold and (best is None or score > best[1]):
+                        best = (document_hash, score)
+                return best
+        except Exception as e:
+            logging.error(f"Near-duplicate index read error: {str(e)}")
+            return None
+
+    def add(self, document_hash: str, signature: np.ndarray) -> None:
+        """Store a document's signature, pruning the oldest beyond max_documents"""
+        try:
+            with self._lock:
+                with self._connect() as conn:
+                    conn.execute(
+                        "INSERT OR IGNORE INTO signatures (document_hash, signature, created) VALUES (?, ?, ?)",
+                        (document_hash, signature.astype(np.uint32).tobytes(), time.time())
+                    )
+                    conn.execute(
+                        "DELETE FROM signatures WHERE id <= ("
+                        " SELECT id FROM signatures ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                        (self.max_documents,)
+                    )
+                self._sync(force=True)
+        except Exception as e:
+            logging.error(f"Near-duplicate index write error: {str(e)}")
+
+
+_indexes: Dict[str, NearDuplicateIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(cache_path: Optional[str]) -> Optional[NearDuplicateIndex]:
+    """Process-wide index stored alongside the analysis cache at cache_path (None if disabled)"""
+    if not NEAR_DUPLICATE_REUSE or not cache_path:
+        return None
+    with _indexes_lock:
+        if cache_path not in _indexes:
+            try:
+                _indexes[cache_path] = NearDuplicateIndex(cache_path)
+            except Exception as e:
+                logging.error(f"Near-duplicate index unavailable: {str(e)}")
+                return None
+        return _indexes[cache_path]
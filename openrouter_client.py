@@ -1,15 +1,361 @@
 import os
 import requests
-from typing import Dict
+from requests.adapters import HTTPAdapter
+from typing import Callable, Dict, Generator, Iterable, Iterator, List, Optional, Tuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+import threading
+import hashlib
+import random
+import time
 import json
-import re
 import logging
 
+from analysis_cache import AnalysisCache, get_cache
+from text_normaliser import TextNormaliser, normalise_text
+import progress
+import relevance
+import near_duplicates
+import keyword_extractor
+import schedule_extractor
+import token_budget
+from chunking import (
+    PAGE_BREAK,
+    estimate_tokens,
+    iter_chunks,
+    merge_keywords,
+    merge_schedules,
+    merge_structures,
+    split_into_chunks,
+)
+
+# Analysis name -> OpenRouterClient method. The four calls are independent,
+# so run_analyses() can fan them out concurrently.
+ANALYSES = {
+    "structure": "analyze_document_structure",
+    "word_cloud": "generate_word_cloud_data",
+    "schedule": "extract_schedule",
+    "summary": "summarize_text",
+}
+
+# Analyses whose cached results a near-duplicate document (same outline,
+# different section or export) can reuse. The schedule is left out because
+# dates and sessions differ between sections.
+NEAR_DUPLICATE_ANALYSES = ("structure", "word_cloud", "summary")
+
+# Prompt templates. The document text is appended after each one; the
+# templates are also hashed into the analysis cache key (see prompt_version).
+STRUCTURE_PROMPT = (
+    "You are an expert academic document analyzer. Analyze this academic document and extract its complete structure. "
+    "Focus on identifying:\n\n"
+    "1. Course Objectives (including all specific learning goals)\n"
+    "2. Course Areas (all tracks and specializations)\n"
+    "3. Competencies (required skills and outcomes)\n"
+    "4. Course Assessments (all evaluation methods)\n"
+    "5. Course Information (detailed course content)\n"
+    "6. University Policies (including accessibility)\n"
+    "7. Resources (all reading materials)\n"
+    "8. Synopsis (course overview)\n"
+    "9. Prerequisites (required background)\n"
+    "10. Teaching Staff (instructor information)\n"
+    "11. Lesson Plan (course schedule)\n\n"
+    "Return ONLY a JSON object with this structure:\n"
+    "{\n"
+    '  "sections": [\n'
+    '    {\n'
+    '      "title": "Section Name",\n'
+    '      "level": 1,\n'
+    '      "subsections": [\n'
+    '        {\n'
+    '          "title": "Subsection Name",\n'
+    '          "items": ["Item 1", "Item 2"]\n'
+    '        }\n'
+    '      ]\n'
+    '    }\n'
+    '  ],\n'
+    '  "learning_objectives": ["Objective 1", "Objective 2"],\n'
+    '  "competencies": ["Competency 1", "Competency 2"],\n'
+    '  "resources": ["Resource 1", "Resource 2"]\n'
+    "}\n\n"
+)
+
+SCHEDULE_PROMPT = (
+    "You are an expert course schedule analyzer. Extract the complete course schedule from this academic document. "
+    "Identify:\n\n"
+    "1. All course milestones and deadlines\n"
+    "2. Weekly topics and activities\n"
+    "3. Assessment dates\n"
+    "4. Project timelines\n"
+    "5. Important events\n\n"
+    "Return ONLY a JSON object with this structure:\n"
+    "{\n"
+    '  "milestones": [\n'
+    '    {\n'
+    '      "type": "Assignment/Quiz/Project",\n'
+    '      "description": "Detailed description",\n'
+    '      "week": "Week number"\n'
+    '    }\n'
+    '  ],\n'
+    '  "weekly_plan": [\n'
+    '    {\n'
+    '      "week": "Week number",\n'
+    '      "topic": "Main topic",\n'
+    '      "activities": ["Activity 1", "Activity 2"]\n'
+    '    }\n'
+    '  ]\n'
+    "}\n\n"
+)
+
+WORD_CLOUD_PROMPT = (
+    "You are an expert in academic content analysis. Analyze this academic document and identify the most important keywords and concepts. "
+    "Consider:\n\n"
+    "1. Course-specific terminology\n"
+    "2. Key learning objectives\n"
+    "3. Important skills and competencies\n"
+    "4. Assessment types\n"
+    "5. Core topics and concepts\n"
+    "6. Resource types\n\n"
+    "Return ONLY a JSON array of objects with words and their importance scores (1-100):\n"
+    "[\n"
+    '  {"word": "keyword", "score": importance_score}\n'
+    "]\n\n"
+)
+
+SUMMARY_PROMPT = (
+    "You are an expert academic document analyzer. Create a comprehensive summary of this academic document. "
+    "Include the following sections:\n\n"
+    "1. 🎯 TL;DR (Brief Overview)\n"
+    "2. 🌟 Key Learning Objectives\n"
+    "3. 📚 Course Content\n"
+    "4. 📝 Assessment Methods\n"
+    "5. 💡 Important Policies\n"
+    "6. 📅 Key Dates and Milestones\n\n"
+    "Make it engaging and student-friendly while maintaining academic accuracy. "
+    "Use clear headings and bullet points where appropriate.\n\n"
+)
+
+SUMMARY_REDUCE_PROMPT = (
+    "You are an expert academic document analyzer. The following are summaries of consecutive parts "
+    "of one long academic document. Merge them into a single comprehensive summary of the whole document, "
+    "removing repetition. Include the following sections:\n\n"
+    "1. 🎯 TL;DR (Brief Overview)\n"
+    "2. 🌟 Key Learning Objectives\n"
+    "3. 📚 Course Content\n"
+    "4. 📝 Assessment Methods\n"
+    "5. 💡 Important Policies\n"
+    "6. 📅 Key Dates and Milestones\n\n"
+    "Make it engaging and student-friendly while maintaining academic accuracy. "
+    "Use clear headings and bullet points where appropriate.\n\n"
+)
+
+# Sections of the combined-analysis envelope, in prompt order: analysis name ->
+# (envelope key, instruction line, JSON schema lines)
+COMBINED_SECTIONS = {
+    "structure": (
+        "structure",
+        "- structure: the complete document structure (course objectives, course areas, competencies, "
+        "assessments, course information, university policies, resources, synopsis, prerequisites, "
+        "teaching staff, lesson plan)\n",
+        '  "structure": {\n'
+        '    "sections": [{"title": "Section Name", "level": 1, "subsections": [{"title": "Subsection Name", "items": ["Item 1"]}]}],\n'
+        '    "learning_objectives": ["Objective 1"],\n'
+        '    "competencies": ["Competency 1"],\n'
+        '    "resources": ["Resource 1"]\n'
+        '  }',
+    ),
+    "schedule": (
+        "schedule",
+        "- schedule: all milestones, deadlines, assessment dates and weekly topics/activities\n",
+        '  "schedule": {\n'
+        '    "milestones": [{"type": "Assignment/Quiz/Project", "description": "Detailed description", "week": "Week number"}],\n'
+        '    "weekly_plan": [{"week": "Week number", "topic": "Main topic", "activities": ["Activity 1"]}]\n'
+        '  }',
+    ),
+    "word_cloud": (
+        "keywords",
+        "- keywords: the most important course-specific keywords and concepts with importance scores (1-100)\n",
+        '  "keywords": [{"word": "keyword", "score": importance_score}]',
+    ),
+    "summary": (
+        "summary",
+        "- summary: a student-friendly markdown summary with the sections 🎯 TL;DR, 🌟 Key Learning Objectives, "
+        "📚 Course Content, 📝 Assessment Methods, 💡 Important Policies, 📅 Key Dates and Milestones\n",
+        '  "summary": "Markdown summary"',
+    ),
+}
+
+
+def combined_prompt(names: Iterable[str]) -> str:
+    """Prompt asking for the given analyses in one JSON envelope"""
+    sections = [COMBINED_SECTIONS[name] for name in COMBINED_SECTIONS if name in set(names)]
+    keys = [key for key, _, _ in sections]
+    listed = keys[0] if len(keys) == 1 else f"{', '.join(keys[:-1])} and {keys[-1]}"
+    return (
+        "You are an expert academic document analyzer. Analyze this academic document and return "
+        f"its {listed} in ONE JSON object.\n\n"
+        + "".join(instruction for _, instruction, _ in sections)
+        + "\nReturn ONLY a JSON object with this structure:\n"
+        + "{\n" + ",\n".join(schema for _, _, schema in sections) + "\n}\n\n"
+    )
+
+
+COMBINED_PROMPT = combined_prompt(COMBINED_SECTIONS)
+
+PROMPTS = {
+    "structure": STRUCTURE_PROMPT,
+    "schedule": SCHEDULE_PROMPT,
+    "word_cloud": WORD_CLOUD_PROMPT,
+    "summary": SUMMARY_PROMPT,
+    "summary_reduce": SUMMARY_REDUCE_PROMPT,
+    "combined": COMBINED_PROMPT,
+}
+
+
+def prompt_version(name: str) -> str:
+    """Short hash of a prompt template, so cached results expire when it changes"""
+    return hashlib.sha256(PROMPTS[name].encode('utf-8')).hexdigest()[:12]
+
+_refresh_executor = None
+_refreshing = set()
+_refresh_lock = threading.Lock()
+
+
+def _get_refresh_executor() -> ThreadPoolExecutor:
+    """Single background worker for refreshing reused near-duplicate analyses"""
+    global _refresh_executor
+    with _refresh_lock:
+        if _refresh_executor is None:
+            _refresh_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="near-duplicate-refresh")
+        return _refresh_executor
+
+# Upstream statuses worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class OpenRouterTransport:
+    """Pooled, retrying HTTP transport shared by all OpenRouterClient instances.
+
+    Keeps one keep-alive requests.Session per process, applies connect/read
+    timeouts, retries 429/5xx and connection errors with exponential backoff
+    and full jitter (honouring Retry-After), and caps the number of concurrent
+    upstream connections with a semaphore.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 8,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 120.0,
+        max_retries: int = 3,
+        backoff_base: float = 1.0,
+        backoff_max: float = 30.0,
+    ):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._semaphore = threading.BoundedSemaphore(max_connections)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    @classmethod
+    def from_env(cls) -> "OpenRouterTransport":
+        """Build a transport from OPENROUTER_* environment variables"""
+        return cls(
+            max_connections=int(os.getenv('OPENROUTER_MAX_CONNECTIONS', '8')),
+            connect_timeout=float(os.getenv('OPENROUTER_CONNECT_TIMEOUT', '5')),
+            read_timeout=float(os.getenv('OPENROUTER_READ_TIMEOUT', '120')),
+            max_retries=int(os.getenv('OPENROUTER_MAX_RETRIES', '3')),
+        )
+
+    def _retry_delay(self, attempt: int, response=None) -> float:
+        """Seconds to wait before the next attempt"""
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                try:
+                    delta = parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)
+                    return min(max(delta.total_seconds(), 0.0), self.backoff_max)
+                except (TypeError, ValueError):
+                    pass
+        # Exponential backoff with full jitter
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        """POST with pooling, timeouts and retries. Returns the last response."""
+        kwargs.setdefault('timeout', (self.connect_timeout, self.read_timeout))
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                with self._semaphore:
+                    response = self.session.post(url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if last_attempt:
+                    raise
+                delay = self._retry_delay(attempt)
+                logging.warning(f"OpenRouter request failed ({str(e)}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            if response.status_code in RETRY_STATUSES and not last_attempt:
+                delay = self._retry_delay(attempt, response)
+                logging.warning(f"OpenRouter returned {response.status_code}, retrying in {delay:.1f}s")
+                response.close()
+                time.sleep(delay)
+                continue
+            return response
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> OpenRouterTransport:
+    """Return the process-wide shared transport, creating it on first use"""
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = OpenRouterTransport.from_env()
+        return _transport
+
 class OpenRouterClient:
-    def __init__(self, api_key: str, model: str = "google/gemini-pro"):
+    def __init__(
+        self,
+        api_key: str,
+        model: str = "google/gemini-pro",
+        combined_analysis: Optional[bool] = None,
+        transport: Optional[OpenRouterTransport] = None,
+        cache: Optional[AnalysisCache] = None,
+    ):
         self.api_key = api_key
         self.model = model
-        self.base_url = "https://openrouter.ai/api/v1"
+        self.transport = transport or get_transport()
+        self.cache = cache if cache is not None else get_cache()
+        if combined_analysis is None:
+            combined_analysis = os.getenv('OPENROUTER_COMBINED_ANALYSIS', 'false').lower() in ('1', 'true', 'yes')
+        self.combined_analysis = combined_analysis
+        # extract_schedule only calls the LLM when the local extractor's
+        # confidence is below this threshold (set above 1 to always call it)
+        self.local_schedule_confidence = float(os.getenv('LOCAL_SCHEDULE_MIN_CONFIDENCE', '0.6'))
+        # Send each analysis only the sections relevant to it
+        self.relevance_filtering = os.getenv('RELEVANCE_FILTERING', 'true').lower() in ('1', 'true', 'yes')
+        # "local" ranks keywords with keyword_extractor instead of an upstream
+        # call; it is the default only once the corpus IDF table has been built
+        default_engine = "local" if os.path.exists(keyword_extractor.IDF_PATH) else "llm"
+        self.keyword_engine = (os.getenv('KEYWORD_ENGINE') or default_engine).lower()
+        # Serve a near-duplicate document's cached analyses (needs the cache)
+        self.near_duplicates = near_duplicates.get_index(self.cache.path) if self.cache is not None else None
+        # Re-run reused analyses in the background and replace the reused copies
+        self.refresh_near_duplicates = os.getenv('NEAR_DUPLICATE_REFRESH', 'false').lower() in ('1', 'true', 'yes')
+        # Overridable to point at a proxy or a mock upstream (load tests)
+        self.base_url = os.getenv('OPENROUTER_BASE_URL', 'https://openrouter.ai/api/v1').rstrip('/')
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
             "HTTP-Referer": os.getenv('ALLOWED_HOST', 'http://localhost:5000'),
@@ -34,13 +380,8 @@ class OpenRouterClient:
             return False
 
     def _get_max_tokens(self) -> int:
-        """Get max tokens based on model"""
-        if self.model == "google/gemini-flash-1.5":
-            return 1500
-        elif self.model == "anthropic/claude-3.5-sonnet:beta":
-            return 3000
-        else:  # gemini-pro
-            return 4000
+        """Usual completion length for the model (see token_budget.MODEL_LIMITS)"""
+        return token_budget.model_limits(self.model)["output"]
 
     def _get_temperature(self) -> float:
         """Get temperature based on model"""
@@ -51,67 +392,87 @@ class OpenRouterClient:
         else:  # gemini-pro
             return 0.3  # Balanced for default model
 
+    def _request_completion(self, prompt: str, max_tokens: Optional[int] = None) -> Optional[str]:
+        """Send a single-prompt chat completion and return the message content"""
+        response = self.transport.post(
+            f"{self.base_url}/chat/completions",
+            headers=self.headers,
+            json={
+                "model": self.model,
+                "messages": [{"role": "user", "content": prompt}],
+                "temperature": self._get_temperature(),
+                "max_tokens": max_tokens or token_budget.output_budget(self.model, prompt)
+            }
+        )
+        
+        if not self._validate_response(response):
+            return None
+        
+        result = response.json()
+        return result['choices'][0]['message']['content']
+
+    def _stream_completion(self, prompt: str, parts: list) -> Generator[str, None, bool]:
+        """Stream a chat completion over SSE, yielding content deltas.
+
+        Deltas are also appended to parts. Returns True if the stream ended
+        with the [DONE] sentinel.
+        """
+        response = self.transport.post(
+            f"{self.base_url}/chat/completions",
+            headers=self.headers,
+            json={
+                "model": self.model,
+                "messages": [{"role": "user", "content": prompt}],
+                "temperature": self._get_temperature(),
+                "max_tokens": token_budget.output_budget(self.model, prompt),
+                "stream": True
+            },
+            stream=True
+        )
+        with response:
+            response.raise_for_status()
+            for line in response.iter_lines(decode_unicode=True):
+                # Skip keep-alive blanks and SSE comments (": OPENROUTER PROCESSING")
+                if not line or not line.startswith('data:'):
+                    continue
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    return True
+                try:
+                    chunk = json.loads(data)
+                except ValueError:
+                    continue
+                if 'error' in chunk:
+                    raise RuntimeError(chunk['error'].get('message', str(chunk['error'])))
+                choices = chunk.get('choices') or [{}]
+                delta = choices[0].get('delta', {}).get('content')
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        return False
+
+    @staticmethod
+    def _extract_json(content: str, open_char: str, close_char: str):
+        """Parse the outermost JSON object/array embedded in a model response"""
+        json_start = content.find(open_char)
+        json_end = content.rfind(close_char) + 1
+        if json_start >= 0 and json_end > json_start:
+            return json.loads(content[json_start:json_end])
+        return None
+
     def analyze_document_structure(self, text: str) -> Dict:
         """Analyze document structure using selected model"""
         try:
-            prompt = (
-                "You are an expert academic document analyzer. Analyze this academic document and extract its complete structure. "
-                "Focus on identifying:\n\n"
-                "1. Course Objectives (including all specific learning goals)\n"
-                "2. Course Areas (all tracks and specializations)\n"
-                "3. Competencies (required skills and outcomes)\n"
-                "4. Course Assessments (all evaluation methods)\n"
-                "5. Course Information (detailed course content)\n"
-                "6. University Policies (including accessibility)\n"
-                "7. Resources (all reading materials)\n"
-                "8. Synopsis (course overview)\n"
-                "9. Prerequisites (required background)\n"
-                "10. Teaching Staff (instructor information)\n"
-                "11. Lesson Plan (course schedule)\n\n"
-                "Return ONLY a JSON object with this structure:\n"
-                "{\n"
-                '  "sections": [\n'
-                '    {\n'
-                '      "title": "Section Name",\n'
-                '      "level": 1,\n'
-                '      "subsections": [\n'
-                '        {\n'
-                '          "title": "Subsection Name",\n'
-                '          "items": ["Item 1", "Item 2"]\n'
-                '        }\n'
-                '      ]\n'
-                '    }\n'
-                '  ],\n'
-                '  "learning_objectives": ["Objective 1", "Objective 2"],\n'
-                '  "competencies": ["Competency 1", "Competency 2"],\n'
-                '  "resources": ["Resource 1", "Resource 2"]\n'
-                "}\n\n"
-                f"Text to analyze: {text}"
-            )
-
-            response = requests.post(
-                f"{self.base_url}/chat/completions",
-                headers=self.headers,
-                json={
-                    "model": self.model,
-                    "messages": [{"role": "user", "content": prompt}],
-                    "temperature": self._get_temperature(),
-                    "max_tokens": self._get_max_tokens()
-                }
-            )
-            
-            if not self._validate_response(response):
+            prompt = f"{STRUCTURE_PROMPT}Text to analyze: {text}"
+
+            content = self._request_completion(prompt)
+            if content is None:
                 return {"error": "Invalid API response"}
             
-            result = response.json()
-            content = result['choices'][0]['message']['content']
-            
             # Extract JSON from response
-            json_start = content.find('{')
-            json_end = content.rfind('}') + 1
-            if json_start >= 0 and json_end > json_start:
-                json_str = content[json_start:json_end]
-                return json.loads(json_str)
+            data = self._extract_json(content, '{', '}')
+            if data is not None:
+                return data
             
             return {"error": "Could not parse document structure"}
 
@@ -119,60 +480,31 @@ class OpenRouterClient:
             print(f"Document structure analysis error: {str(e)}")
             return {"error": str(e)}
 
+    def _local_schedule(self, text: str) -> Optional[Dict]:
+        """Rule-based schedule if the local extractor is confident enough, else None"""
+        schedule, confidence = schedule_extractor.extract_schedule(text)
+        logging.info(f"Local schedule extraction confidence: {confidence}")
+        if confidence >= self.local_schedule_confidence:
+            return schedule
+        return None
+
     def extract_schedule(self, text: str) -> Dict:
-        """Extract schedule information using selected model"""
+        """Extract schedule information, trying the local extractor before the selected model"""
         try:
-            prompt = (
-                "You are an expert course schedule analyzer. Extract the complete course schedule from this academic document. "
-                "Identify:\n\n"
-                "1. All course milestones and deadlines\n"
-                "2. Weekly topics and activities\n"
-                "3. Assessment dates\n"
-                "4. Project timelines\n"
-                "5. Important events\n\n"
-                "Return ONLY a JSON object with this structure:\n"
-                "{\n"
-                '  "milestones": [\n'
-                '    {\n'
-                '      "type": "Assignment/Quiz/Project",\n'
-                '      "description": "Detailed description",\n'
-                '      "week": "Week number"\n'
-                '    }\n'
-                '  ],\n'
-                '  "weekly_plan": [\n'
-                '    {\n'
-                '      "week": "Week number",\n'
-                '      "topic": "Main topic",\n'
-                '      "activities": ["Activity 1", "Activity 2"]\n'
-                '    }\n'
-                '  ]\n'
-                "}\n\n"
-                f"Text to analyze: {text}"
-            )
-
-            response = requests.post(
-                f"{self.base_url}/chat/completions",
-                headers=self.headers,
-                json={
-                    "model": self.model,
-                    "messages": [{"role": "user", "content": prompt}],
-                    "temperature": self._get_temperature(),
-                    "max_tokens": self._get_max_tokens()
-                }
-            )
-            
-            if not self._validate_response(response):
+            local = self._local_schedule(text)
+            if local is not None:
+                return local
+
+            prompt = f"{SCHEDULE_PROMPT}Text to analyze: {text}"
+
+            content = self._request_completion(prompt)
+            if content is None:
                 return {"error": "Invalid API response"}
             
-            result = response.json()
-            content = result['choices'][0]['message']['content']
-            
             # Extract JSON from response
-            json_start = content.find('{')
-            json_end = content.rfind('}') + 1
-            if json_start >= 0 and json_end > json_start:
-                json_str = content[json_start:json_end]
-                return json.loads(json_str)
+            data = self._extract_json(content, '{', '}')
+            if data is not None:
+                return data
             
             return {"error": "Could not parse schedule data"}
 
@@ -181,47 +513,21 @@ class OpenRouterClient:
             return {"error": str(e)}
 
     def generate_word_cloud_data(self, text: str) -> Dict:
-        """Generate word cloud data using selected model"""
+        """Generate word cloud data using the local keyword engine or the selected model"""
         try:
-            prompt = (
-                "You are an expert in academic content analysis. Analyze this academic document and identify the most important keywords and concepts. "
-                "Consider:\n\n"
-                "1. Course-specific terminology\n"
-                "2. Key learning objectives\n"
-                "3. Important skills and competencies\n"
-                "4. Assessment types\n"
-                "5. Core topics and concepts\n"
-                "6. Resource types\n\n"
-                "Return ONLY a JSON array of objects with words and their importance scores (1-100):\n"
-                "[\n"
-                '  {"word": "keyword", "score": importance_score}\n'
-                "]\n\n"
-                f"Text to analyze: {text}"
-            )
-
-            response = requests.post(
-                f"{self.base_url}/chat/completions",
-                headers=self.headers,
-                json={
-                    "model": self.model,
-                    "messages": [{"role": "user", "content": prompt}],
-                    "temperature": self._get_temperature(),
-                    "max_tokens": self._get_max_tokens()
-                }
-            )
-            
-            if not self._validate_response(response):
+            if self.keyword_engine == "local":
+                return keyword_extractor.extract_keywords(text)
+
+            prompt = f"{WORD_CLOUD_PROMPT}Text to analyze: {text}"
+
+            content = self._request_completion(prompt)
+            if content is None:
                 return {"error": "Invalid API response"}
             
-            result = response.json()
-            content = result['choices'][0]['message']['content']
-            
             # Extract JSON array from response
-            json_start = content.find('[')
-            json_end = content.rfind(']') + 1
-            if json_start >= 0 and json_end > json_start:
-                json_str = content[json_start:json_end]
-                return {"keywords": json.loads(json_str)}
+            data = self._extract_json(content, '[', ']')
+            if data is not None:
+                return {"keywords": data}
             
             return {"error": "Could not parse word cloud data"}
 
@@ -229,53 +535,617 @@ class OpenRouterClient:
             print(f"Word cloud generation error: {str(e)}")
             return {"error": str(e)}
 
-    def preprocess_text(self, text: str) -> str:
-        """Clean and preprocess text for analysis"""
-        # Remove special characters and extra whitespace
-        text = re.sub(r'[^\w\s\.\,\-\:\;\(\)]', ' ', text)
-        text = re.sub(r'\s+', ' ', text).strip()
-        return text
+    @staticmethod
+    def preprocess_pages(pages: Iterable[Tuple[int, str]]) -> Iterator[Tuple[int, str]]:
+        """Lazily preprocess a (page_number, text) stream such as PDFProcessor.iter_pages()"""
+        return TextNormaliser().iter_pages(pages)
+
+    @staticmethod
+    def preprocess_text(text: str) -> str:
+        """Clean and preprocess text for analysis.
+
+        Special characters and extra whitespace are removed in a single
+        pass, page breaks are kept, and header/footer lines repeated across
+        pages are stripped (see text_normaliser).
+        """
+        return normalise_text(text)[0]
 
     def summarize_text(self, text: str) -> Dict:
         """Generate summary using selected model"""
         try:
-            prompt = (
-                "You are an expert academic document analyzer. Create a comprehensive summary of this academic document. "
-                "Include the following sections:\n\n"
-                "1. 🎯 TL;DR (Brief Overview)\n"
-                "2. 🌟 Key Learning Objectives\n"
-                "3. 📚 Course Content\n"
-                "4. 📝 Assessment Methods\n"
-                "5. 💡 Important Policies\n"
-                "6. 📅 Key Dates and Milestones\n\n"
-                "Make it engaging and student-friendly while maintaining academic accuracy. "
-                "Use clear headings and bullet points where appropriate.\n\n"
-                f"Text to analyze: {text}"
-            )
-
-            response = requests.post(
-                f"{self.base_url}/chat/completions",
-                headers=self.headers,
-                json={
-                    "model": self.model,
-                    "messages": [{"role": "user", "content": prompt}],
-                    "temperature": self._get_temperature(),
-                    "max_tokens": self._get_max_tokens()
-                }
-            )
-            
-            if not self._validate_response(response):
+            prompt = f"{SUMMARY_PROMPT}Text to analyze: {text}"
+
+            content = self._request_completion(prompt)
+            if content is None:
                 return {"error": "Invalid API response"}
             
-            result = response.json()
             return {
-                "Summary": result['choices'][0]['message']['content']
+                "Summary": content
             }
             
+        except token_budget.ContextLimitError as e:
+            logging.error(f"Summary not sent: {str(e)}")
+            return {"error": str(e)}
         except requests.exceptions.RequestException as e:
             print(f"Summary generation error: {str(e)}")
             if hasattr(e, 'response') and hasattr(e.response, 'text'):
                 print(f"Error response: {e.response.text}")
             return {
-                "Summary": "Error generating summary. Please try again."
+                "Summary": "Error generating summary. Please try again.",
+                "error": str(e)
+            }
+
+    def stream_summary(
+        self,
+        text: str,
+        document_hash: Optional[str] = None,
+        on_event: Optional[progress.Listener] = None,
+    ) -> Iterator[str]:
+        """Generate the summary as a stream of text fragments.
+
+        Uses the chat-completions SSE stream mode and yields content deltas as
+        they arrive. A cached summary is yielded in one piece; a completed
+        stream is written back to the cache. on_event receives the summary's
+        started/finished events and a tokens_streamed event per delta.
+        """
+        tracker = progress.AnalysisTracker(on_event)
+        fragments, tokens = [], 0
+        try:
+            for fragment in self._stream_summary(text, document_hash, tracker):
+                fragments.append(fragment)
+                tokens += estimate_tokens(fragment)
+                progress.emit(on_event, progress.TOKENS_STREAMED, name="summary", tokens=tokens)
+                yield fragment
+        except Exception as e:
+            tracker.finished("summary", {"error": str(e)})
+            raise
+        summary = {"Summary": "".join(fragments)} if fragments else {"error": "Empty summary stream"}
+        tracker.finished("summary", summary)
+
+    def _stream_summary(
+        self,
+        text: str,
+        document_hash: Optional[str],
+        tracker: progress.AnalysisTracker,
+    ) -> Iterator[str]:
+        """stream_summary() without the events; tracker is told when an upstream request starts"""
+        key = self._cache_key(document_hash, "summary") if self.cache is not None and document_hash else None
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                yield cached["Summary"]
+                return
+
+        signature = None
+        if key is not None and self.near_duplicates is not None:
+            signature = near_duplicates.minhash_signature(text)
+            reused = self._near_duplicate_results(text, document_hash, signature, ["summary"])
+            if reused:
+                yield reused["summary"]["Summary"]
+                return
+
+        tracker.started(["summary"])
+        plan = self._plan("summary", text)
+        text = plan["text"]
+        input_key = None
+        if key is not None and plan["mode"] != "chunked":
+            # A revised document whose summary input is unchanged reuses the summary
+            input_key = self._input_key("summary", text)
+            cached = self.cache.get(input_key)
+            if cached is not None:
+                self.cache.set(key, cached)
+                yield cached["Summary"]
+                return
+
+        if plan["mode"] == "chunked":
+            # Long document: summarise the chunks in parallel, then stream
+            # the reduce step that merges the partial summaries
+            partials = self._map_chunks("summary", split_into_chunks(text, self._chunk_budget("summary")))
+            prompt = self._summary_reduce_prompt(partials)
+        else:
+            prompt = f"{SUMMARY_PROMPT}Text to analyze: {text}"
+
+        parts = []
+        completed = yield from self._stream_completion(prompt, parts)
+
+        if key is not None and completed and parts:
+            summary = {"Summary": "".join(parts)}
+            self.cache.set_many({k: summary for k in (key, input_key) if k is not None})
+            if signature is not None:
+                self.near_duplicates.add(document_hash, signature)
+
+    def run_analyses(
+        self,
+        text: str,
+        analyses: Optional[Iterable[str]] = None,
+        max_workers: int = 4,
+        on_result: Optional[Callable[[str, Dict], None]] = None,
+        plans: Optional[Dict[str, Dict]] = None,
+    ) -> Dict[str, Dict]:
+        """Run the independent analyses concurrently on a bounded thread pool.
+
+        Each analysis fails on its own: an exception becomes an {"error": ...}
+        result for that analysis only. on_result(name, result) is called as
+        each one finishes, in completion order. Each analysis is sent the
+        (possibly trimmed) input of its budget plan.
+        """
+        names = list(analyses) if analyses is not None else list(ANALYSES)
+        plans = plans or {name: self._plan(name, text) for name in names}
+        results = {}
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(names)))) as executor:
+            futures = {
+                executor.submit(self._call_cached, name, plans[name]["text"]): name
+                for name in names
+            }
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logging.error(f"{name} analysis failed: {str(e)}")
+                    result = {"error": str(e)}
+                results[name] = result
+                if on_result is not None:
+                    on_result(name, result)
+        return results
+
+    def analyze_combined(
+        self,
+        text: str,
+        on_result: Optional[Callable[[str, Dict], None]] = None,
+        analyses: Optional[Iterable[str]] = None,
+    ) -> Dict[str, Dict]:
+        """Run the analyses (all four by default) in a single completion.
+
+        The document is sent once under one prompt asking for a single JSON
+        envelope with just those analyses, which is then split into the same
+        dicts the per-analysis methods return. Any section that comes back
+        missing or malformed is re-requested with its own per-analysis call.
+        """
+        names = list(analyses) if analyses is not None else list(ANALYSES)
+        prompt = f"{combined_prompt(names)}Text to analyze: {text}"
+
+        results = {}
+        try:
+            content = self._request_completion(prompt)
+            envelope = self._extract_json(content, '{', '}') if content is not None else None
+            if isinstance(envelope, dict):
+                results = {name: result for name, result in self._split_combined(envelope).items() if name in names}
+        except Exception as e:
+            logging.error(f"Combined analysis error: {str(e)}")
+
+        for name, result in results.items():
+            if on_result is not None:
+                on_result(name, result)
+
+        missing = [name for name in names if name not in results]
+        if missing:
+            logging.warning(f"Combined analysis missing {missing}, falling back to per-analysis calls")
+            results.update(self.run_analyses(text, analyses=missing, on_result=on_result))
+        return results
+
+    @staticmethod
+    def _split_combined(envelope: Dict) -> Dict[str, Dict]:
+        """Split a combined-analysis envelope into per-analysis results, dropping malformed sections"""
+        results = {}
+
+        structure = envelope.get('structure')
+        if isinstance(structure, dict) and isinstance(structure.get('sections'), list):
+            results['structure'] = structure
+
+        schedule = envelope.get('schedule')
+        if (isinstance(schedule, dict)
+                and isinstance(schedule.get('milestones', []), list)
+                and isinstance(schedule.get('weekly_plan'), list)):
+            results['schedule'] = schedule
+
+        keywords = envelope.get('keywords')
+        if isinstance(keywords, list) and keywords and all(
+            isinstance(item, dict) and 'word' in item and 'score' in item for item in keywords
+        ):
+            results['word_cloud'] = {"keywords": keywords}
+
+        summary = envelope.get('summary')
+        if isinstance(summary, str) and summary.strip():
+            results['summary'] = {"Summary": summary}
+
+        return results
+
+    def _context_for(self, name: str, text: str) -> str:
+        """Input text for one analysis, narrowed to its relevant sections when enabled"""
+        if not self.relevance_filtering:
+            return text
+        return relevance.build_context(text, name)
+
+    def _prompt_tokens(self, name: str) -> int:
+        """Tokens an analysis prompt adds to the document text"""
+        return estimate_tokens(f"{PROMPTS[name]}Text to analyze: ")
+
+    def _chunk_budget(self, name: str) -> int:
+        """Document tokens per request for an analysis on this model"""
+        return token_budget.input_limit(self.model, self._prompt_tokens(name))
+
+    def _plan(self, name: str, text: str) -> Dict:
+        """Budget plan (full, trimmed or chunked) for one analysis' input, see token_budget.plan_input"""
+        return token_budget.plan_input(self.model, name, self._context_for(name, text), self._prompt_tokens(name))
+
+    def _map_chunks(self, name: str, chunks: List[str], max_workers: int = 8) -> List[Dict]:
+        """Run one analysis over every chunk in parallel, returning the successful results in order"""
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as executor:
+            outputs = list(executor.map(lambda chunk: self._call_cached(name, chunk), chunks))
+        return [output for output in outputs if isinstance(output, dict) and 'error' not in output]
+
+    @staticmethod
+    def _safe_call(method, text: str) -> Dict:
+        try:
+            return method(text)
+        except Exception as e:
+            logging.error(f"Analysis call failed: {str(e)}")
+            return {"error": str(e)}
+
+    def _input_key(self, name: str, text: str) -> str:
+        """Cache key for one analysis of one exact input (a context or a chunk)"""
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        return AnalysisCache.make_key("input", digest, self.model, name, prompt_version(name))
+
+    def _call_cached(self, name: str, text: str) -> Dict:
+        """Run one analysis on one input, reusing the result of an identical earlier input.
+
+        This is what makes re-analysis of a revised document incremental:
+        analyses (or chunks) whose input sections did not change are served
+        from the cache and only the changed ones go upstream.
+        """
+        key = self._input_key(name, text) if self.cache is not None else None
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                logging.info(f"{name}: input unchanged, reusing cached result")
+                return cached
+        result = self._safe_call(getattr(self, ANALYSES[name]), text)
+        if key is not None and isinstance(result, dict) and 'error' not in result:
+            self.cache.set(key, result)
+        return result
+
+    @staticmethod
+    def _summary_reduce_prompt(partials: List[Dict]) -> str:
+        joined = "\n\n".join(
+            f"Part {i}:\n{partial['Summary']}" for i, partial in enumerate(partials, 1)
+        )
+        return f"{SUMMARY_REDUCE_PROMPT}Partial summaries: {joined}"
+
+    def _reduce(self, name: str, parts: List[Dict]) -> Dict:
+        """Merge per-chunk results into the shape the single-call analysis returns"""
+        if not parts:
+            return {"error": f"All chunks failed for {name} analysis"}
+        if len(parts) == 1:
+            return parts[0]
+        if name == "structure":
+            return merge_structures(parts)
+        if name == "schedule":
+            return merge_schedules(parts)
+        if name == "word_cloud":
+            return merge_keywords(parts)
+        content = self._request_completion(self._summary_reduce_prompt(parts))
+        if content is None:
+            # Fall back to the concatenated partial summaries
+            return {"Summary": "\n\n".join(part['Summary'] for part in parts)}
+        return {"Summary": content}
+
+    def analyze_chunked(
+        self,
+        text: str,
+        analyses: Optional[Iterable[str]] = None,
+        max_workers: int = 8,
+        on_result: Optional[Callable[[str, Dict], None]] = None,
+        plans: Optional[Dict[str, Dict]] = None,
+    ) -> Dict[str, Dict]:
+        """Map-reduce the analyses over page-aligned chunks of a long document.
+
+        Every (analysis, chunk) pair runs in parallel on a bounded pool, so
+        latency scales with the number of chunks in flight rather than with
+        document length. Once all chunks of an analysis finish, the partial
+        outputs are merged and on_result(name, result) is called. Analyses
+        whose budget plan is not "chunked" run as a single chunk.
+        """
+        names = list(analyses) if analyses is not None else list(ANALYSES)
+        plans = plans or {name: self._plan(name, text) for name in names}
+        chunks = {
+            name: split_into_chunks(plans[name]["text"], self._chunk_budget(name))
+            if plans[name]["mode"] == "chunked" else [plans[name]["text"]]
+            for name in names
+        }
+        logging.info(f"Analysing chunks: { {name: len(parts) for name, parts in chunks.items()} }")
+        partials = {name: [None] * len(chunks[name]) for name in names}
+        remaining = {name: len(chunks[name]) for name in names}
+        results = {}
+        total = sum(remaining.values())
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, total))) as executor:
+            tasks = {
+                executor.submit(self._call_cached, name, chunk): ("map", name, index)
+                for name in names
+                for index, chunk in enumerate(chunks[name])
             }
+            pending = set(tasks)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    kind, name, index = tasks[future]
+                    if kind == "map":
+                        partials[name][index] = future.result()
+                        remaining[name] -= 1
+                        if remaining[name] == 0:
+                            parts = [p for p in partials[name] if isinstance(p, dict) and 'error' not in p]
+                            reduce_future = executor.submit(self._reduce, name, parts)
+                            tasks[reduce_future] = ("reduce", name, None)
+                            pending.add(reduce_future)
+                        continue
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logging.error(f"{name} reduce failed: {str(e)}")
+                        result = {"error": str(e)}
+                    results[name] = result
+                    if on_result is not None:
+                        on_result(name, result)
+        return results
+
+    def _cache_key(self, document_hash: str, name: str) -> str:
+        """Cache key for one analysis: document hash + model + prompt version (or local engine)"""
+        version = "local" if name == "word_cloud" and self.keyword_engine == "local" else prompt_version(name)
+        return AnalysisCache.make_key("analysis", document_hash, self.model, name, version)
+
+    def _cached_results(
+        self,
+        document_hash: Optional[str],
+        names: List[str],
+        on_result: Optional[Callable[[str, Dict], None]] = None,
+    ) -> Dict[str, Dict]:
+        """Cached analyses for a document, reported through on_result"""
+        results = {}
+        if self.cache is None or document_hash is None:
+            return results
+        for name in names:
+            cached = self.cache.get(self._cache_key(document_hash, name))
+            if cached is not None:
+                results[name] = cached
+                if on_result is not None:
+                    on_result(name, cached)
+        return results
+
+    def _streamable(self, name: str) -> bool:
+        """Whether an analysis can start on chunks before the whole document is extracted.
+
+        Analyses that need the full text first (local fast paths and
+        relevance-filtered contexts) are not streamable. Near-duplicate
+        reuse does not stop streaming: analyze_pages() drops the streamed
+        calls once the full text turns out to match an earlier document.
+        """
+        if name == "schedule" or (name == "word_cloud" and self.keyword_engine == "local"):
+            return False
+        return not (self.relevance_filtering and name in relevance.ANALYSIS_PROFILES)
+
+    def analyze_pages(
+        self,
+        pages: Iterable[Tuple[int, str]],
+        on_result: Optional[Callable[[str, Dict], None]] = None,
+        document_hash: Optional[str] = None,
+        on_event: Optional[progress.Listener] = None,
+    ) -> Dict[str, Dict]:
+        """Run all analyses over a lazy stream of preprocessed (page_number, text) pages.
+
+        Streamable analyses are dispatched chunk by chunk while later pages
+        are still being extracted; once the stream ends, the per-chunk
+        results are merged (a single chunk needs no merge) and the remaining
+        analyses run on the full text via analyze_all(). If every analysis
+        is cached the page stream is never consumed. The last chunk is only
+        dispatched after the near-duplicate lookup on the full text: when the
+        document is a near-duplicate of an analysed one, that document's
+        results replace the streamed analyses, their outstanding chunk calls
+        are cancelled and the last chunk is never sent for them. on_event receives each analysis's started/finished
+        progress events (see progress).
+        """
+        names = list(ANALYSES)
+        tracker = progress.AnalysisTracker(on_event, on_result)
+        results = self._cached_results(document_hash, names, tracker.finished)
+        missing = [name for name in names if name not in results]
+        if not missing:
+            return results
+
+        early = [] if self.combined_analysis else [name for name in missing if self._streamable(name)]
+        page_texts = []
+
+        def collect():
+            for _, page_text in pages:
+                page_texts.append(page_text)
+                yield page_text
+
+        executor = ThreadPoolExecutor(max_workers=8)
+        try:
+            futures = {name: [] for name in early}
+            budget = min((self._chunk_budget(name) for name in early), default=self._chunk_budget("summary"))
+            # Each chunk is dispatched once the next one arrives; the last (for
+            # most outlines the only) chunk waits for the near-duplicate lookup
+            held = None
+            for chunk in iter_chunks(collect(), budget):
+                if held is not None:
+                    tracker.started(early)
+                    for name in early:
+                        futures[name].append(executor.submit(self._call_cached, name, held))
+                held = chunk
+            text = PAGE_BREAK.join(page_texts)
+            del page_texts[:]
+
+            signature, reused = None, {}
+            if early and document_hash is not None and self.cache is not None and self.near_duplicates is not None:
+                signature = near_duplicates.minhash_signature(text)
+                reused = self._near_duplicate_results(text, document_hash, signature, early, tracker.finished)
+                for name in reused:
+                    for future in futures[name]:
+                        future.cancel()
+                results.update(reused)
+                early = [name for name in early if name not in reused]
+            if held is not None and early:
+                tracker.started(early)
+                for name in early:
+                    futures[name].append(executor.submit(self._call_cached, name, held))
+
+            rest = [name for name in missing if name not in early and name not in reused]
+            if rest:
+                results.update(self.analyze_all(
+                    text, on_result=on_result, document_hash=document_hash, analyses=rest, on_event=on_event
+                ))
+
+            for name in early:
+                outputs = [future.result() for future in futures[name]]
+                if len(outputs) == 1:
+                    result = outputs[0]
+                else:
+                    result = self._reduce(name, [o for o in outputs if isinstance(o, dict) and 'error' not in o])
+                if document_hash is not None and self.cache is not None and 'error' not in result:
+                    self.cache.set(self._cache_key(document_hash, name), result)
+                results[name] = result
+                tracker.finished(name, result)
+            if signature is not None:
+                self.near_duplicates.add(document_hash, signature)
+        finally:
+            # Calls already running for reused analyses finish in the background
+            executor.shutdown(wait=False, cancel_futures=True)
+        return results
+
+    def analyze_all(
+        self,
+        text: str,
+        on_result: Optional[Callable[[str, Dict], None]] = None,
+        document_hash: Optional[str] = None,
+        analyses: Optional[Iterable[str]] = None,
+        on_event: Optional[progress.Listener] = None,
+    ) -> Dict[str, Dict]:
+        """Run the analyses using the configured mode (combined or concurrent).
+
+        When document_hash (SHA-256 of the uploaded bytes) is given and the
+        cache is enabled, cached analyses are returned immediately and only
+        the misses are sent upstream. Successful results are cached. Misses
+        whose input (relevant sections or chunk) is identical to an earlier
+        document's, e.g. in a revised outline, are also reused, and so are
+        the structure, keywords and summary of a near-duplicate document
+        (see near_duplicates), optionally refreshed in the background.
+
+        on_event receives analysis_started when an analysis is computed and
+        analysis_finished (marked cached for reused results) as each one
+        finishes; see progress.
+        """
+        names = list(analyses) if analyses is not None else list(ANALYSES)
+        use_cache = self.cache is not None and document_hash is not None
+        tracker = progress.AnalysisTracker(on_event, on_result)
+        on_result = tracker.finished
+        results = self._cached_results(document_hash, names, on_result)
+
+        if "schedule" in names and "schedule" not in results:
+            # Fast path: regular lesson-plan tables need no upstream call
+            tracker.started(["schedule"])
+            local = self._local_schedule(text)
+            if local is not None:
+                results["schedule"] = local
+                if use_cache:
+                    self.cache.set(self._cache_key(document_hash, "schedule"), local)
+                on_result("schedule", local)
+
+        if "word_cloud" in names and "word_cloud" not in results and self.keyword_engine == "local":
+            # Local keyword ranking takes milliseconds, so it is never
+            # chunked; it is cached so a fully cached upload skips extraction
+            tracker.started(["word_cloud"])
+            results["word_cloud"] = self.generate_word_cloud_data(text)
+            if use_cache and 'error' not in results["word_cloud"]:
+                self.cache.set(self._cache_key(document_hash, "word_cloud"), results["word_cloud"])
+            on_result("word_cloud", results["word_cloud"])
+
+        missing = [name for name in names if name not in results]
+        if not missing:
+            return results
+
+        signature = None
+        if use_cache and self.near_duplicates is not None:
+            signature = near_duplicates.minhash_signature(text)
+            reused = self._near_duplicate_results(text, document_hash, signature, missing, on_result)
+            results.update(reused)
+            missing = [name for name in missing if name not in results]
+
+        if missing:
+            tracker.started(missing)
+            fresh = self._compute(text, missing, on_result)
+            if use_cache:
+                for name, result in fresh.items():
+                    if isinstance(result, dict) and 'error' not in result:
+                        self.cache.set(self._cache_key(document_hash, name), result)
+            results.update(fresh)
+        if signature is not None:
+            self.near_duplicates.add(document_hash, signature)
+        return results
+
+    def _compute(
+        self,
+        text: str,
+        names: List[str],
+        on_result: Optional[Callable[[str, Dict], None]] = None,
+    ) -> Dict[str, Dict]:
+        """Run analyses upstream in the mode their budget plans need: chunked, combined or concurrent"""
+        # Whatever local and cached answers left over still goes in one request
+        if self.combined_analysis and len(names) > 1:
+            if token_budget.plan_input(self.model, "combined", text, self._prompt_tokens("combined"))["mode"] == "full":
+                return self.analyze_combined(text, on_result=on_result, analyses=names)
+        plans = {name: self._plan(name, text) for name in names}
+        if any(plan["mode"] == "chunked" for plan in plans.values()):
+            return self.analyze_chunked(text, analyses=names, on_result=on_result, plans=plans)
+        return self.run_analyses(text, analyses=names, on_result=on_result, plans=plans)
+
+    def _near_duplicate_results(
+        self,
+        text: str,
+        document_hash: str,
+        signature,
+        names: List[str],
+        on_result: Optional[Callable[[str, Dict], None]] = None,
+    ) -> Dict[str, Dict]:
+        """Cached analyses of the most similar earlier document, stored under this document's hash too"""
+        names = [name for name in names if name in NEAR_DUPLICATE_ANALYSES]
+        match = self.near_duplicates.query(signature, exclude=document_hash) if names else None
+        if match is None:
+            return {}
+        source_hash, score = match
+        keys = {self._cache_key(source_hash, name): name for name in names}
+        results = {keys[key]: result for key, result in self.cache.get_many(keys).items()}
+        if not results:
+            return {}
+        logging.info(
+            f"Near-duplicate of {source_hash[:12]} (similarity {score:.2f}): reusing {', '.join(results)}"
+        )
+        self.cache.set_many({self._cache_key(document_hash, name): result for name, result in results.items()})
+        if on_result is not None:
+            for name, result in results.items():
+                on_result(name, result)
+        if self.refresh_near_duplicates:
+            self._refresh_in_background(text, document_hash, list(results))
+        return results
+
+    def _refresh_in_background(self, text: str, document_hash: str, names: List[str]):
+        """Recompute reused analyses for this document and replace the reused copies in the cache"""
+        with _refresh_lock:
+            if document_hash in _refreshing:
+                return
+            _refreshing.add(document_hash)
+
+        def refresh():
+            try:
+                fresh = self._compute(text, names)
+                self.cache.set_many({
+                    self._cache_key(document_hash, name): result for name, result in fresh.items()
+                    if isinstance(result, dict) and 'error' not in result
+                })
+                logging.info(f"Refreshed near-duplicate analyses for {document_hash[:12]}: {', '.join(fresh)}")
+            except Exception as e:
+                logging.error(f"Near-duplicate refresh failed: {str(e)}")
+            finally:
+                with _refresh_lock:
+                    _refreshing.discard(document_hash)
+
+        _get_refresh_executor().submit(refresh)
@@ -0,0 +1,296 @@
+import io
+import os
+import re
+import json
+import logging
+import importlib
+import importlib.util
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Backends in the order they are tried when no benchmark results exist:
+# roughly fastest first. PyPDF2 and pypdfium2 are hard dependencies, so
+# text and table layout are always available; the others are used only
+# when installed.
+BACKEND_PREFERENCE = ["pypdfium2", "PyPDF2", "pypdf", "pdfminer"]
+
+# Written by benchmarks/bench_backends.py --write and read at startup
+BENCHMARK_PATH = os.getenv('PDF_BACKEND_BENCHMARK', '.cache/pdf_backends.json')
+
+# A backend is only ranked by speed if its text quality is within this
+# fraction of the best backend's on the benchmark corpus
+QUALITY_TOLERANCE = 0.9
+
+_WORD = re.compile(r"[A-Za-z]+")
+_PDFIUM_LOCK = threading.Lock()  # PDFium is not thread-safe
+
+
+class _PyPDFDocument:
+    """PyPDF2 and pypdf share the PdfReader API.
+
+    There is no page_runs(): their text visitor reports whole text objects
+    at the position where each object starts, not per-cell runs, so the
+    layout of their pages is taken from another backend (see layout_backend).
+    """
+
+    def __init__(self, module, stream):
+        self._reader = module.PdfReader(stream)
+
+    def __len__(self) -> int:
+        return len(self._reader.pages)
+
+    def page_text(self, index: int) -> str:
+        return self._reader.pages[index].extract_text() or ""
+
+    def close(self):
+        pass
+
+
+class _PdfminerDocument:
+    def __init__(self, stream):
+        from pdfminer.layout import LAParams
+        from pdfminer.pdfdocument import PDFDocument
+        from pdfminer.pdfinterp import PDFResourceManager
+        from pdfminer.pdfpage import PDFPage
+        from pdfminer.pdfparser import PDFParser
+
+        # Only the page tree is resolved here; content streams are parsed per page
+        self._pages = list(PDFPage.create_pages(PDFDocument(PDFParser(stream))))
+        self._manager = PDFResourceManager(caching=True)
+        self._laparams = LAParams()
+        # Tighter character grouping keeps narrow adjacent table cells apart
+        self._layout_laparams = LAParams(char_margin=1.0)
+
+    def page_runs(self, index: int) -> List[Tuple[float, float, float, str]]:
+        from pdfminer.converter import PDFPageAggregator
+        from pdfminer.layout import LTTextContainer, LTTextLine
+        from pdfminer.pdfinterp import PDFPageInterpreter
+
+        device = PDFPageAggregator(self._manager, laparams=self._layout_laparams)
+        PDFPageInterpreter(self._manager, device).process_page(self._pages[index])
+        runs = []
+        for element in device.get_result():
+            if isinstance(element, LTTextContainer):
+                for line in element:
+                    if isinstance(line, LTTextLine):
+                        x0, _, x1, top = line.bbox
+                        runs.append((x0, x1, top, line.get_text().strip()))
+        return runs
+
+    def __len__(self) -> int:
+        return len(self._pages)
+
+    def page_text(self, index: int) -> str:
+        from pdfminer.converter import TextConverter
+        from pdfminer.pdfinterp import PDFPageInterpreter
+
+        output = io.StringIO()
+        device = TextConverter(self._manager, output, laparams=self._laparams)
+        try:
+            PDFPageInterpreter(self._manager, device).process_page(self._pages[index])
+        finally:
+            device.close()
+        return output.getvalue()
+
+    def close(self):
+        pass
+
+
+class _MappedReader(io.RawIOBase):
+    """File-like view of an mmap; PDFium's stream loader needs readinto()"""
+
+    def __init__(self, mapped):
+        self._mapped = mapped
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        self._mapped.seek(offset, whence)
+        return self._mapped.tell()
+
+    def tell(self) -> int:
+        return self._mapped.tell()
+
+    def readinto(self, buffer) -> int:
+        data = self._mapped.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class _PdfiumDocument:
+    def __init__(self, stream):
+        import pypdfium2
+
+        if not hasattr(stream, 'readinto'):
+            stream = _MappedReader(stream)
+        with _PDFIUM_LOCK:
+            self._document = pypdfium2.PdfDocument(stream)
+
+    def __len__(self) -> int:
+        return len(self._document)
+
+    def page_text(self, index: int) -> str:
+        with _PDFIUM_LOCK:
+            page = self._document[index]
+            textpage = page.get_textpage()
+            try:
+                text = textpage.get_text_range()
+            finally:
+                textpage.close()
+                page.close()
+        return text.replace("\r\n", "\n")
+
+    def page_runs(self, index: int) -> List[Tuple[float, float, float, str]]:
+        with _PDFIUM_LOCK:
+            page = self._document[index]
+            textpage = page.get_textpage()
+            try:
+                runs = []
+                for rect in range(textpage.count_rects()):
+                    left, bottom, right, top = textpage.get_rect(rect)
+                    text = textpage.get_text_bounded(left, bottom, right, top)
+                    runs.append((left, right, top, text.strip()))
+            finally:
+                textpage.close()
+                page.close()
+        return runs
+
+    def close(self):
+        with _PDFIUM_LOCK:
+            self._document.close()
+
+
+class ExtractionBackend:
+    """A PDF text-extraction library behind a common open / page_text interface.
+
+    open(stream) returns a document with len(), page_text(index) and
+    close(). Backends with layout also have page_runs(index), which
+    returns positioned text runs (x0, x1, top, text) in PDF points, for
+    layout analysis such as table_extractor. Streams are seekable binary
+    files or mmaps and are left open.
+    """
+
+    def __init__(self, name: str, module: str, opener: Callable, layout: bool = True):
+        self.name = name
+        self.module = module
+        self._opener = opener
+        self.layout = layout
+
+    def available(self) -> bool:
+        return importlib.util.find_spec(self.module) is not None
+
+    def open(self, stream):
+        return self._opener(stream)
+
+    def __repr__(self) -> str:
+        return f"ExtractionBackend({self.name!r})"
+
+
+BACKENDS: Dict[str, ExtractionBackend] = {
+    backend.name: backend for backend in (
+        ExtractionBackend("pypdfium2", "pypdfium2", _PdfiumDocument),
+        ExtractionBackend(
+            "pypdf", "pypdf", lambda stream: _PyPDFDocument(importlib.import_module("pypdf"), stream), layout=False
+        ),
+        ExtractionBackend("pdfminer", "pdfminer", _PdfminerDocument),
+        ExtractionBackend(
+            "PyPDF2", "PyPDF2", lambda stream: _PyPDFDocument(importlib.import_module("PyPDF2"), stream), layout=False
+        ),
+    )
+}
+
+
+def available_backends() -> List[str]:
+    """Names of the installed backends, in preference order"""
+    return [name for name in BACKEND_PREFERENCE if BACKENDS[name].available()]
+
+
+def text_quality(text: str) -> float:
+    """Share of alphabetic tokens that look like ordinary words (2-20 letters).
+
+    Broken extraction shows up as letters split apart ("T h e") or words run
+    together ("Thecourseintroduces"), both of which lower the score.
+    """
+    words = _WORD.findall(text)
+    if not words:
+        return 0.0
+    return sum(2 <= len(word) <= 20 for word in words) / len(words)
+
+
+def rank_backends(results: Dict[str, Dict]) -> List[str]:
+    """Order benchmarked backends: fastest first among those with acceptable quality.
+
+    results maps backend name to {"pages_per_second", "quality"}; backends
+    whose quality falls short of QUALITY_TOLERANCE * best go last.
+    """
+    usable = {name: result for name, result in results.items() if "pages_per_second" in result}
+    if not usable:
+        return []
+    floor = QUALITY_TOLERANCE * max(result["quality"] for result in usable.values())
+    return sorted(
+        usable,
+        key=lambda name: (usable[name]["quality"] < floor, -usable[name]["pages_per_second"])
+    )
+
+
+def _benchmark_ranking(path: str) -> List[str]:
+    try:
+        with open(path) as f:
+            return json.load(f).get("ranking", [])
+    except FileNotFoundError:
+        return []
+    except Exception as e:
+        logging.error(f"Could not read PDF backend benchmark {path}: {str(e)}")
+        return []
+
+
+def select_backend(name: Optional[str] = None) -> ExtractionBackend:
+    """Pick the extraction backend: an explicit name, PDF_BACKEND, or "auto".
+
+    Auto picks the first installed backend in the ranking written by the
+    backend benchmark, falling back to BACKEND_PREFERENCE. An unknown or
+    uninstalled explicit choice logs a warning and falls back to auto.
+    """
+    requested = name or os.getenv('PDF_BACKEND', 'auto')
+    if requested != 'auto':
+        backend = BACKENDS.get(requested)
+        if backend is not None and backend.available():
+            return backend
+        logging.warning(f"PDF backend {requested!r} is not available, selecting automatically")
+    for candidate in _benchmark_ranking(BENCHMARK_PATH) + BACKEND_PREFERENCE:
+        backend = BACKENDS.get(candidate)
+        if backend is not None and backend.available():
+            return backend
+    raise RuntimeError("No PDF extraction backend is installed")
+
+
+def layout_backend(backend: ExtractionBackend) -> Optional[ExtractionBackend]:
+    """Backend whose page_runs() lay out pages extracted with backend.
+
+    That is backend itself if it has layout, else the first installed
+    backend in BACKEND_PREFERENCE that has, or None.
+    """
+    if backend.layout:
+        return backend
+    for name in BACKEND_PREFERENCE:
+        if BACKENDS[name].layout and BACKENDS[name].available():
+            return BACKENDS[name]
+    return None
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> ExtractionBackend:
+    """Backend selected once per process"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = select_backend()
+            logging.info(f"PDF extraction backend: {_backend.name}")
+        return _backend
@@ -1,15 +1,436 @@
 import io
+import os
+import mmap
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
 import PyPDF2
+from typing import Iterator, List, Optional, Tuple, Union
+
+import progress
+import table_extractor
+from analysis_cache import AnalysisCache
+from chunking import PAGE_BREAK
+from extraction_sandbox import ExtractionLimitError, ExtractionSandbox
+from pdf_backends import BACKENDS, ExtractionBackend, get_backend, layout_backend
+
+# Documents with fewer pages left to extract than this are extracted as a
+# single job: below it, splitting them across workers costs more than it saves.
+PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', '32'))
+EXTRACT_WORKERS = int(os.getenv('PDF_EXTRACT_WORKERS') or os.cpu_count() or 1)
+# Uploads larger than this are memory-mapped from disk (spooling them to a
+# temp file first if needed) instead of being handed to the extraction backend in memory
+SPOOL_THRESHOLD = int(os.getenv('PDF_SPOOL_THRESHOLD', str(2 * 1024 * 1024)))
+# Documents beyond these limits are rejected before (or while) extracting
+MAX_PAGES = int(os.getenv('PDF_MAX_PAGES', '500'))
+MAX_CHARS = int(os.getenv('PDF_MAX_CHARS', '2000000'))
+# Lay out pages that look like they hold a lesson-plan table and replace the
+# flattened table text with one compact line per row (see table_extractor).
+# Needs pypdfium2 or pdfminer: PyPDF2 and pypdf pages are laid out with one of them
+TABLE_EXTRACTION = os.getenv('PDF_TABLE_EXTRACTION', 'true').lower() == 'true'
+
+_sandbox = None
+_sandbox_lock = threading.Lock()
+
+
+def _get_sandbox() -> ExtractionSandbox:
+    """Extraction workers shared by every extraction in this process"""
+    global _sandbox
+    with _sandbox_lock:
+        if _sandbox is None:
+            _sandbox = ExtractionSandbox(max_workers=EXTRACT_WORKERS)
+        return _sandbox
+
+
+def _stream_size(stream) -> int:
+    """Length of a seekable stream, leaving its position unchanged"""
+    position = stream.tell()
+    size = stream.seek(0, io.SEEK_END)
+    stream.seek(position)
+    return size
+
+
+class PDFSource:
+    """Seekable, copy-free view of an uploaded PDF.
+
+    Small uploads are read in place (no read() + BytesIO copy). Larger ones
+    that already live on disk (Werkzeug spools big requests to a temp file)
+    are memory-mapped; anything else is spooled to a named temp file in
+    1 MB blocks and memory-mapped, so peak memory stays near one copy.
+    Use as a context manager so the mapping and temp file are released.
+    """
+
+    def __init__(self, pdf_file, spool_threshold: int = None):
+        # Werkzeug's FileStorage wraps the underlying stream
+        self._file = getattr(pdf_file, 'stream', pdf_file)
+        self._maps = []
+        self._tempfile = None
+        self._file.seek(0)
+        self.size = _stream_size(self._file)
+        threshold = SPOOL_THRESHOLD if spool_threshold is None else spool_threshold
+        if self.size <= threshold:
+            self.stream = self._file
+            return
+        try:
+            self.stream = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps.append(self.stream)
+        except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+            self._spool()
+
+    def _spool(self):
+        """Copy the upload to a named temp file and map it"""
+        self._file.seek(0)
+        self._tempfile = tempfile.NamedTemporaryFile(suffix='.pdf')
+        shutil.copyfileobj(self._file, self._tempfile, 1024 * 1024)
+        self._tempfile.flush()
+        # Earlier mappings stay open until close(): a reader may still use them
+        self.stream = mmap.mmap(self._tempfile.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(self.stream)
+
+    def shareable(self) -> Union[bytes, str]:
+        """What to hand a worker process: a small upload's bytes, otherwise a file path"""
+        if self.stream is not self._file:
+            return self.path
+        self._file.seek(0)
+        data = self._file.read()
+        self._file.seek(0)
+        return data
+
+    def _existing_path(self) -> Optional[str]:
+        """Path of the file already holding the upload, if it is on disk"""
+        name = getattr(self._file, 'name', None)
+        if isinstance(name, str) and os.path.isfile(name):
+            return os.path.abspath(name)
+        # Unnamed temp files (Werkzeug spools large requests to one) are
+        # still reachable through this process's descriptor
+        try:
+            fd_path = f"/proc/{os.getpid()}/fd/{self._file.fileno()}"
+        except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+            return None
+        return fd_path if os.path.exists(fd_path) else None
+
+    @property
+    def path(self) -> str:
+        """Filesystem path worker processes can open: the upload's own file, else a temp copy"""
+        if self._tempfile is None:
+            existing = self._existing_path()
+            if existing is not None:
+                return existing
+            self._spool()
+        return self._tempfile.name
+
+    def close(self):
+        for mapped in self._maps:
+            mapped.close()
+        self._maps = []
+        if self._tempfile is not None:
+            self._tempfile.close()
+            self._tempfile = None
+        self._file.seek(0)
+
+    def __enter__(self) -> "PDFSource":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _resolve_backend(backend: Optional[str]) -> ExtractionBackend:
+    return get_backend() if backend is None else BACKENDS[backend]
+
+
+def _table_layout(backend: ExtractionBackend) -> Optional[ExtractionBackend]:
+    """Backend that lays out tables in pages extracted with backend, or None when tables are off"""
+    return layout_backend(backend) if TABLE_EXTRACTION else None
+
+
+def _layout(backend: ExtractionBackend) -> str:
+    """Cache-key component for how page text is laid out"""
+    layout = _table_layout(backend)
+    if layout is None:
+        return "plain"
+    if layout is backend:
+        return table_extractor.LAYOUT_VERSION
+    return f"{table_extractor.LAYOUT_VERSION}-{layout.name}"
+
+
+def _open_source(source: Union[bytes, str]):
+    """Worker side: a readable stream over bytes, or a memory map of a file path"""
+    if isinstance(source, bytes):
+        return io.BytesIO(source)
+    with open(source, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _hash_value(digest, value):
+    """Add a PDF object to digest: a stream's decoded data, anything else by its repr"""
+    value = value.get_object() if value is not None else None
+    digest.update(value.get_data() if hasattr(value, 'get_data') else repr(value).encode())
+
+
+def _hash_resources(digest, resources, seen: set):
+    """Add the fonts and Form XObjects of a resource dictionary to digest, recursing into the forms.
+
+    Fonts are hashed with their Encoding and ToUnicode maps, Form XObjects
+    with their content streams; seen holds the forms already hashed, so
+    shared or self-referencing forms are hashed once.
+    """
+    if resources is None:
+        return
+    resources = resources.get_object()
+    fonts = resources.get('/Font')
+    fonts = fonts.get_object() if fonts is not None else {}
+    for name in sorted(fonts):
+        font = fonts[name].get_object()
+        digest.update(repr((name, font.get('/BaseFont'))).encode())
+        _hash_value(digest, font.get('/Encoding'))
+        _hash_value(digest, font.get('/ToUnicode'))
+    xobjects = resources.get('/XObject')
+    xobjects = xobjects.get_object() if xobjects is not None else {}
+    for name in sorted(xobjects):
+        reference = xobjects[name]
+        xobject = reference.get_object()
+        if xobject.get('/Subtype') != '/Form':
+            continue
+        key = (reference.idnum, reference.generation) if hasattr(reference, 'idnum') else id(xobject)
+        digest.update(name.encode())
+        if key in seen:
+            continue
+        seen.add(key)
+        digest.update(xobject.get_data())
+        _hash_resources(digest, xobject.get('/Resources'), seen)
+
+
+def _page_fingerprint(page) -> str:
+    """Hash of everything that determines a page's text, computed without extracting it.
+
+    That is the page's content stream, plus the content streams of the Form
+    XObjects it draws (which may hold all of its text), and the fonts with
+    their encodings, since the same content stream can decode to different
+    text under a different font encoding or ToUnicode map.
+    """
+    digest = hashlib.sha256()
+    contents = page.get_contents()
+    if contents is not None:
+        digest.update(contents.get_data())
+    _hash_resources(digest, page.get('/Resources'), set())
+    return digest.hexdigest()
+
+
+def _inspect_document(
+    source: Union[bytes, str],
+    backend: str,
+    fingerprint: bool,
+    max_pages: int,
+) -> Tuple[int, Optional[List[str]]]:
+    """Worker: page count (checked against max_pages) and, if asked, page fingerprints"""
+    stream = _open_source(source)
+    try:
+        document = BACKENDS[backend].open(stream)
+        try:
+            page_count = len(document)
+        finally:
+            document.close()
+        if page_count > max_pages:
+            raise ExtractionLimitError(f"PDF has {page_count} pages; the limit is {max_pages}")
+        if not fingerprint:
+            return page_count, None
+        try:
+            stream.seek(0)
+            return page_count, [_page_fingerprint(page) for page in PyPDF2.PdfReader(stream).pages]
+        except Exception as e:
+            logging.warning(f"Could not fingerprint pages, extracting without the page cache: {str(e)}")
+            return page_count, None
+    finally:
+        stream.close()
+
+
+def _extract_page_range(
+    source: Union[bytes, str],
+    start: int,
+    end: int,
+    backend: str,
+    max_chars: int,
+    layout: Optional[str] = None,
+) -> List[str]:
+    """Worker: extract pages [start, end), stopping early past max_chars.
+
+    With a layout backend, pages that may hold a lesson-plan table are laid
+    out with it and the table is restructured; a page whose layout fails
+    keeps its text. A layout backend other than backend opens the document
+    separately, on the first page that needs it.
+    """
+    stream = _open_source(source)
+    layout_stream, layout_document = None, None
+    try:
+        document = BACKENDS[backend].open(stream)
+        try:
+            texts, total = [], 0
+            for index in range(start, end):
+                text = document.page_text(index)
+                if layout is not None and table_extractor.may_contain_table(text):
+                    try:
+                        if layout == backend:
+                            layout_document = document
+                        elif layout_document is None:
+                            layout_stream = _open_source(source)
+                            layout_document = BACKENDS[layout].open(layout_stream)
+                        text = table_extractor.restructure_page(text, layout_document.page_runs(index))
+                    except Exception as e:
+                        logging.warning(f"Table layout failed on page {index + 1}: {str(e)}")
+                texts.append(text)
+                total += len(texts[-1])
+                if total > max_chars:
+                    raise ExtractionLimitError(f"PDF text exceeds the {max_chars} character limit")
+            return texts
+        finally:
+            document.close()
+            if layout_document is not None and layout_document is not document:
+                layout_document.close()
+    finally:
+        stream.close()
+        if layout_stream is not None:
+            layout_stream.close()
+
 
 class PDFProcessor:
     @staticmethod
-    def extract_text(pdf_file) -> str:
-        """Extract text content from uploaded PDF file"""
+    def iter_pages(
+        source: Union[bytes, PDFSource],
+        workers: Optional[int] = None,
+        backend: Optional[str] = None,
+        cache: Optional[AnalysisCache] = None,
+        on_event: Optional[progress.Listener] = None,
+    ) -> Iterator[Tuple[int, str]]:
+        """Lazily yield (page_number, text) for every page, in order.
+
+        All parsing happens in sandboxed worker processes (see
+        ExtractionSandbox) under a per-job timeout, a memory cap, and the
+        MAX_PAGES / MAX_CHARS limits; any
+        violation raises ExtractionLimitError. Large documents are split
+        into contiguous page ranges extracted in parallel, and pages are
+        yielded as soon as their range (and every range before it) is done,
+        so downstream stages can start before extraction finishes. Small
+        documents (or workers=1) are extracted as a single job.
+
+        backend names an entry in pdf_backends.BACKENDS; by default the
+        process-wide backend chosen at startup is used.
+
+        Lesson-plan tables are restructured into compact rows when
+        TABLE_EXTRACTION is on and a backend with layout is installed (see
+        table_extractor and pdf_backends.layout_backend).
+
+        With a cache, pages are fingerprinted first and only pages not seen
+        before (in any document) are extracted, so a revised outline only
+        pays for the pages that changed. Newly extracted pages are cached.
+
+        on_event receives a pages_extracted progress event (see progress)
+        as each page is yielded.
+        """
+        extraction_backend = _resolve_backend(backend)
+        table_layout = _table_layout(extraction_backend)
+        workers = EXTRACT_WORKERS if workers is None else workers
+        # This document's jobs share a bounded number of the sandbox's workers
+        jobs = _get_sandbox().document()
+        shared = source if isinstance(source, bytes) else source.shareable()
+
+        page_count, fingerprints = jobs.run(
+            _inspect_document, shared, extraction_backend.name, cache is not None, MAX_PAGES
+        )
+        keys, cached, fresh = [], {}, {}
+        if cache is not None and fingerprints is not None and len(fingerprints) == page_count:
+            keys = [
+                AnalysisCache.make_key("page", fingerprint, extraction_backend.name, _layout(extraction_backend))
+                for fingerprint in fingerprints
+            ]
+            found = cache.get_many(keys)
+            cached = {index: found[key] for index, key in enumerate(keys) if key in found}
+            if len(cached) == page_count:
+                logging.info(f"Page cache: all {page_count} pages previously extracted")
+            elif cached:
+                changed = [index + 1 for index in range(page_count) if index not in cached]
+                logging.info(f"Page cache: {len(cached)}/{page_count} pages unchanged, extracting pages {changed}")
+
+        # A few ranges per worker keeps the workers busy when pages vary in
+        # cost; ranges that are entirely cached are not submitted
+        if workers <= 1 or page_count - len(cached) < PARALLEL_MIN_PAGES:
+            range_count = min(page_count, 1)
+        else:
+            range_count = min(page_count, workers * 4)
+        bounds = [page_count * i // range_count for i in range(range_count + 1)] if range_count else [0]
+        futures = {
+            start: jobs.submit(
+                _extract_page_range, shared, start, end, extraction_backend.name, MAX_CHARS,
+                table_layout.name if table_layout is not None else None
+            )
+            for start, end in zip(bounds, bounds[1:])
+            if any(index not in cached for index in range(start, end))
+        }
+        total_chars = 0
         try:
-            pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_file.read()))
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-            return text.strip()
+            for start, end in zip(bounds, bounds[1:]):
+                if start in futures:
+                    texts = futures[start].result()
+                    fresh.update((start + offset, text) for offset, text in enumerate(texts))
+                else:
+                    texts = [cached[index] for index in range(start, end)]
+                for offset, text in enumerate(texts):
+                    total_chars += len(text)
+                    if total_chars > MAX_CHARS:
+                        raise ExtractionLimitError(f"PDF text exceeds the {MAX_CHARS} character limit")
+                    progress.emit(on_event, progress.PAGES_EXTRACTED, pages=start + offset + 1, total=page_count)
+                    yield start + offset + 1, text
+        finally:
+            for future in futures.values():
+                future.cancel()
+            if keys and fresh:
+                cache.set_many({keys[index]: text for index, text in fresh.items()})
+
+    @staticmethod
+    def extract_pages(
+        source: Union[bytes, PDFSource],
+        workers: Optional[int] = None,
+        backend: Optional[str] = None,
+    ) -> List[str]:
+        """Extract the text of every page, in order"""
+        return [text for _, text in PDFProcessor.iter_pages(source, workers, backend)]
+
+    @staticmethod
+    def extract_text(
+        pdf_file,
+        workers: Optional[int] = None,
+        cache: Optional[AnalysisCache] = None,
+        on_event: Optional[progress.Listener] = None,
+    ) -> str:
+        """Extract text content from uploaded PDF file, pages separated by PAGE_BREAK"""
+        try:
+            with PDFSource(pdf_file) as source:
+                pages = [text for _, text in PDFProcessor.iter_pages(source, workers, cache=cache, on_event=on_event)]
+            return "".join(page + "\n" + PAGE_BREAK for page in pages).strip()
         except Exception as e:
             raise Exception(f"Error processing PDF: {str(e)}")
+
+    @staticmethod
+    def extract_text_cached(
+        pdf_file,
+        document_hash: str,
+        cache: Optional[AnalysisCache] = None,
+        workers: Optional[int] = None,
+        on_event: Optional[progress.Listener] = None,
+    ) -> str:
+        """Extract text, reusing the cached text for a previously seen document or its pages"""
+        if cache is None:
+            return PDFProcessor.extract_text(pdf_file, workers, on_event=on_event)
+        # Backends (and table layouts) give slightly different text, so each gets its own entry
+        key = AnalysisCache.make_key("text", document_hash, get_backend().name, _layout(get_backend()))
+        text = cache.get(key)
+        if text is None:
+            # A revised upload still reuses the pages it shares with earlier versions
+            text = PDFProcessor.extract_text(pdf_file, workers, cache, on_event)
+            cache.set(key, text)
+        else:
+            pages = text.count(PAGE_BREAK) + 1
+            progress.emit(on_event, progress.PAGES_EXTRACTED, pages=pages, total=pages, cached=True)
+        return text
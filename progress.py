@@ -0,0 +1,66 @@
+import time
+import logging
+import threading
+from typing import Callable, Dict, Iterable, Optional
+
+# Progress events are dicts with an "event" kind, the wall-clock "time" they
+# were emitted at, and kind-specific fields:
+#   pages_extracted    pages, total (pages extracted so far, of the document)
+#   tokens_streamed    name, tokens (completion tokens received so far)
+#   analysis_started   name
+#   analysis_finished  name, status ("done" or "failed"), seconds, cached
+PAGES_EXTRACTED = "pages_extracted"
+TOKENS_STREAMED = "tokens_streamed"
+ANALYSIS_STARTED = "analysis_started"
+ANALYSIS_FINISHED = "analysis_finished"
+
+Listener = Callable[[Dict], None]
+
+
+def emit(listener: Optional[Listener], event: str, **fields) -> None:
+    """Send one event to listener; a failing listener is logged, never raised into the pipeline"""
+    if listener is None:
+        return
+    try:
+        listener({"event": event, "time": time.time(), **fields})
+    except Exception as e:
+        logging.error(f"Progress listener error: {str(e)}")
+
+
+class AnalysisTracker:
+    """Emits started/finished events, with durations, for a set of analyses.
+
+    finished() has the on_result(name, result) signature: it emits
+    analysis_finished and then forwards to on_result, so it can be passed
+    wherever an on_result callback is taken. Analyses that finish without
+    having been started (cache hits) are reported as cached. Callbacks may
+    come from several threads at once.
+    """
+
+    def __init__(self, listener: Optional[Listener], on_result: Optional[Callable[[str, Dict], None]] = None):
+        self.listener = listener
+        self.on_result = on_result
+        self._started: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def started(self, names: Iterable[str]) -> None:
+        for name in names:
+            with self._lock:
+                if name in self._started:
+                    continue
+                self._started[name] = time.monotonic()
+            emit(self.listener, ANALYSIS_STARTED, name=name)
+
+    def finished(self, name: str, result: Dict) -> None:
+        with self._lock:
+            started = self._started.get(name)
+        failed = isinstance(result, dict) and 'error' in result
+        emit(
+            self.listener, ANALYSIS_FINISHED,
+            name=name,
+            status="failed" if failed else "done",
+            seconds=round(time.monotonic() - started, 3) if started is not None else 0.0,
+            cached=started is None,
+        )
+        if self.on_result is not None:
+            self.on_result(name, result)
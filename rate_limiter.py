@@ -0,0 +1,175 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+# Analyses a client may start per window, across both front-ends and every
+# process sharing the store (0 disables the limit)
+RATE_LIMIT_REQUESTS = int(os.getenv('RATE_LIMIT_REQUESTS', '10'))
+RATE_LIMIT_WINDOW = int(os.getenv('RATE_LIMIT_WINDOW', '3600'))
+# Counters live here so gunicorn workers and Streamlit processes on the host share them
+RATE_LIMIT_STORE_PATH = os.getenv('RATE_LIMIT_STORE_PATH', '.cache/rate_limits.sqlite3')
+# Most clients tracked at once; the least recently seen are dropped beyond it
+RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', '100000'))
+# Seconds between sweeps for idle keys, per process
+EVICT_INTERVAL = 60.0
+
+
+class RateLimiter:
+    """Sliding-window counter per client key, stored in SQLite.
+
+    Each key keeps two counters: requests in the current fixed window and
+    in the previous one. The rate over the sliding window ending now is
+    estimated as previous * (share of the previous window still inside
+    the sliding window) + current, so a check reads and writes one row
+    whatever the request history, and memory per key is constant. Checks
+    run in an immediate transaction, so concurrent processes sharing the
+    database never both take the last slot. Keys idle for two windows
+    carry no information and are swept out, as are the least recently
+    seen keys beyond max_keys.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        limit: int = RATE_LIMIT_REQUESTS,
+        window_seconds: int = RATE_LIMIT_WINDOW,
+        max_keys: int = RATE_LIMIT_MAX_KEYS,
+    ):
+        self.path = path
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.max_keys = max_keys
+        self._evicted = 0.0
+        self._lock = threading.Lock()
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS rate_limits ("
+                    " key TEXT PRIMARY KEY,"
+                    " window INTEGER NOT NULL,"
+                    " current INTEGER NOT NULL,"
+                    " previous INTEGER NOT NULL,"
+                    " updated REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS rate_limits_updated ON rate_limits (updated)")
+        except Exception as e:
+            logging.error(f"Rate limit store unavailable: {str(e)}")
+
+    @contextmanager
+    def _connect(self):
+        # Autocommit mode, so hit() can open its own BEGIN IMMEDIATE transaction
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _counts(self, row: Optional[Tuple[int, int, int]], window: int) -> Tuple[int, int]:
+        """(current, previous) counts of a stored row as of the given window"""
+        if row is None:
+            return 0, 0
+        stored_window, current, previous = row
+        if stored_window == window:
+            return current, previous
+        if stored_window == window - 1:
+            return 0, current
+        return 0, 0
+
+    def _retry_after(self, current: int, previous: int, elapsed: float) -> float:
+        """Seconds until a request would be allowed again"""
+        if current < self.limit:
+            # Room opens in this window once the previous window's weight has shrunk enough
+            share = 1 - (self.limit - 1 - current) / previous
+            return max(0.0, share * self.window_seconds - elapsed)
+        # Only the next window frees room; its estimate starts at current and decays
+        left = self.window_seconds - elapsed
+        return left + self.window_seconds * max(0.0, 1 - (self.limit - 1) / current)
+
+    def hit(self, key: str) -> Tuple[bool, float]:
+        """Count one request for key if it is within the limit.
+
+        Returns (allowed, retry_after): a refused request is not counted,
+        and retry_after is the number of seconds until one would be
+        allowed. If the store is unavailable, requests are allowed.
+        """
+        if self.limit <= 0:
+            return True, 0.0
+        now = time.time()
+        window = int(now // self.window_seconds)
+        elapsed = now - window * self.window_seconds
+        try:
+            with self._connect() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    row = conn.execute(
+                        "SELECT window, current, previous FROM rate_limits WHERE key = ?", (key,)
+                    ).fetchone()
+                    current, previous = self._counts(row, window)
+                    estimate = previous * (1 - elapsed / self.window_seconds) + current
+                    allowed = estimate + 1 <= self.limit
+                    if allowed:
+                        conn.execute(
+                            "INSERT OR REPLACE INTO rate_limits (key, window, current, previous, updated)"
+                            " VALUES (?, ?, ?, ?, ?)",
+                            (key, window, current + 1, previous, now)
+                        )
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+                self._evict(conn, now)
+        except Exception as e:
+            logging.error(f"Rate limit store error: {str(e)}")
+            return True, 0.0
+        if not allowed:
+            logging.warning(f"Rate limit exceeded for {key}")
+            return False, self._retry_after(current, previous, elapsed)
+        return True, 0.0
+
+    def refund(self, key: str) -> None:
+        """Uncount a request hit() allowed for key that was not served after all (e.g. a full queue)"""
+        if self.limit <= 0:
+            return
+        window = int(time.time() // self.window_seconds)
+        try:
+            with self._connect() as conn:
+                # A request counted in the window that has just ended is left counted
+                conn.execute(
+                    "UPDATE rate_limits SET current = current - 1 WHERE key = ? AND window = ? AND current > 0",
+                    (key, window)
+                )
+        except Exception as e:
+            logging.error(f"Rate limit store error: {str(e)}")
+
+    def _evict(self, conn, now: float):
+        """Drop idle keys and the least recently seen beyond max_keys, at most every EVICT_INTERVAL"""
+        with self._lock:
+            if now - self._evicted < EVICT_INTERVAL:
+                return
+            self._evicted = now
+        conn.execute("DELETE FROM rate_limits WHERE updated < ?", (now - 2 * self.window_seconds,))
+        conn.execute(
+            "DELETE FROM rate_limits WHERE updated <= ("
+            " SELECT updated FROM rate_limits ORDER BY updated DESC LIMIT 1 OFFSET ?)",
+            (self.max_keys,)
+        )
+
+
+_limiters: Dict[Tuple[int, int], RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(limit: int = RATE_LIMIT_REQUESTS, window_seconds: int = RATE_LIMIT_WINDOW) -> RateLimiter:
+    """Process-wide limiter over the shared store for a limit and window"""
+    with _limiters_lock:
+        if (limit, window_seconds) not in _limiters:
+            _limiters[(limit, window_seconds)] = RateLimiter(RATE_LIMIT_STORE_PATH, limit, window_seconds)
+        return _limiters[(limit, window_seconds)]
@@ -0,0 +1,139 @@
+import os
+import re
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from chunking import PAGE_BREAK, estimate_tokens, truncate_tokens
+
+# Section categories and the headings SMU course outlines use for them.
+# Headings are matched in Title Case or UPPER CASE only, so ordinary prose
+# ("the assessment will ...") does not start a new section.
+SECTION_HEADINGS = {
+    "synopsis": ["Course Description", "Course Synopsis", "Synopsis", "Course Overview"],
+    "objectives": ["Learning Objectives", "Learning Outcomes", "Course Objectives", "Graduate Learning Outcomes"],
+    "prerequisites": ["Pre-requisites", "Prerequisites", "Pre-requisite", "Co-requisites", "Mutually Exclusive"],
+    "assessment": ["Assessment Methods", "Assessment", "Assessments", "Grading", "Class Participation"],
+    "lesson_plan": ["Lesson Plan", "Weekly Lesson Plan", "Course Schedule", "Weekly Schedule", "Schedule"],
+    "resources": ["Recommended Text", "Recommended Reading", "Required Text", "Readings", "Resources", "References"],
+    "staff": ["Teaching Staff", "Instructors", "Consultation Hours", "Contact Details"],
+    "policies": [
+        "Academic Integrity", "University Policies", "Accessibility", "Copyright", "Absence from Class",
+        "Provision of Student Accessibility", "Class Recordings", "Personal Data Protection"
+    ],
+}
+
+# Per-analysis relevance profiles: category weights (categories left out are
+# dropped), keywords that raise a section's score, and the default input
+# token budget. Analyses without a profile always get the full document.
+ANALYSIS_PROFILES = {
+    "schedule": {
+        "weights": {"lesson_plan": 3.0, "assessment": 2.0, "other": 0.5},
+        "keywords": ["week", "session", "quiz", "exam", "test", "due", "deadline", "submission", "project", "presentation"],
+        "budget": 4000,
+    },
+    "word_cloud": {
+        "weights": {
+            "synopsis": 2.0, "objectives": 2.0, "lesson_plan": 1.5, "assessment": 1.0,
+            "prerequisites": 1.0, "resources": 0.5, "other": 1.0
+        },
+        "keywords": [],
+        "budget": 6000,
+    },
+}
+
+_HEADING = re.compile(
+    r'\b(' + '|'.join(
+        sorted(
+            {re.escape(form) for headings in SECTION_HEADINGS.values() for heading in headings
+             for form in (heading, heading.upper())},
+            key=len, reverse=True
+        )
+    ) + r')\b'
+)
+_HEADING_CATEGORY = {
+    form: category
+    for category, headings in SECTION_HEADINGS.items()
+    for heading in headings
+    for form in (heading, heading.upper())
+}
+_WORD = re.compile(r'\w+')
+
+
+def segment(text: str) -> List[Tuple[str, str]]:
+    """Split preprocessed text into (category, text) sections at detected headings.
+
+    Text before the first heading is categorised as "other".
+    """
+    sections = []
+    position, category = 0, "other"
+    for match in _HEADING.finditer(text):
+        if match.start() > position:
+            sections.append((category, text[position:match.start()]))
+        position, category = match.start(), _HEADING_CATEGORY[match.group(1)]
+    if position < len(text):
+        sections.append((category, text[position:]))
+    return [(category, body) for category, body in sections if body.strip()]
+
+
+def _budgets_from_env() -> Dict[str, int]:
+    """Parse RELEVANCE_BUDGETS, e.g. "schedule=4000,word_cloud=6000" """
+    budgets = {}
+    for item in os.getenv('RELEVANCE_BUDGETS', '').split(','):
+        name, _, value = item.partition('=')
+        if name.strip() and value.strip().isdigit():
+            budgets[name.strip()] = int(value)
+    return budgets
+
+
+def build_context(text: str, analysis: str, budget: Optional[int] = None) -> str:
+    """Smaller input for one analysis: its most relevant sections, in document order.
+
+    Sections are ranked by category weight and keyword density and added
+    until the token budget is reached (the top section is truncated if it
+    alone exceeds it). Sections are joined with PAGE_BREAK so long contexts
+    still chunk on section boundaries. Falls back to the full text when the
+    analysis has no profile, the outline has too few recognisable headings,
+    or filtering would not save anything.
+    """
+    profile = ANALYSIS_PROFILES.get(analysis)
+    if profile is None:
+        return text
+    if budget is None:
+        budget = _budgets_from_env().get(analysis, profile["budget"])
+
+    sections = segment(text)
+    if len({category for category, _ in sections}) < 3:
+        return text
+
+    keywords = set(profile["keywords"])
+    scored = []
+    for index, (category, body) in enumerate(sections):
+        weight = profile["weights"].get(category, 0.0)
+        if weight <= 0:
+            continue
+        words = _WORD.findall(body.lower())
+        density = sum(word in keywords for word in words) * 100 / max(len(words), 1)
+        scored.append((weight * (1 + density), index))
+
+    selected, used = {}, 0
+    for rank, (score, index) in enumerate(sorted(scored, reverse=True)):
+        body = sections[index][1].strip()
+        tokens = estimate_tokens(body)
+        if used + tokens > budget:
+            if rank > 0:
+                continue
+            body = truncate_tokens(body, budget)
+            tokens = estimate_tokens(body)
+        selected[index] = body
+        used += tokens
+    if not selected:
+        return text
+
+    context = PAGE_BREAK.join(selected[index] for index in sorted(selected))
+    if len(context) >= 0.9 * len(text):
+        return text
+    logging.info(
+        f"Relevance filter for {analysis}: kept {len(selected)}/{len(sections)} sections, "
+        f"{estimate_tokens(context)}/{estimate_tokens(text)} tokens"
+    )
+    return context
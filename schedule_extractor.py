@@ -0,0 +1,217 @@
+import re
+from typing import Dict, List, Optional, Tuple
+
+import table_extractor
+
+# Lesson-plan rows in SMU outlines start with "Week N" (sometimes "Session N"
+# or "Lesson N"); assessments and deadlines are named with a small, regular
+# vocabulary, so compiled patterns recover the schedule without an LLM call.
+_WEEK = re.compile(r'\b(?:Week|Wk|Session|Lesson)\s*(\d{1,2})\b', re.IGNORECASE)
+_ASSESSMENT = re.compile(
+    # Multi-word names come first, so "Project proposal due" is one milestone
+    r'\b((?:group|individual|team)\s+project(?:\s+(?:proposal|report|presentation))?|'
+    r'project\s+(?:proposal|report|presentation)|'
+    r'final\s+(?:exam(?:ination)?|test|project|report|presentation)|'
+    r'mid[- ]?term(?:\s+(?:exam(?:ination)?|test|quiz))?|(?:lab|class)\s+test|'
+    r'exam(?:ination)?|quiz(?:zes)?|test|project|assignment|presentation|proposal|report|submission|deadline)\b'
+    r'(?:\s*\d+)?(?:\s+(?:due|submission|deadline|presentation))?',
+    re.IGNORECASE
+)
+_DATE = re.compile(
+    r'\b(?:\d{1,2}\s+(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Sept|Oct|Nov|Dec)[a-z]*(?:\s+\d{4})?'
+    r'|(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Sept|Oct|Nov|Dec)[a-z]*\s+\d{1,2}(?:,?\s+\d{4})?'
+    r'|\d{1,2}/\d{1,2}/\d{2,4})\b',
+    re.IGNORECASE
+)
+_RECESS = re.compile(r'\b(recess|reading)\s+week\b', re.IGNORECASE)
+
+# Largest gap between consecutive rows of the same lesson plan (recess weeks
+# are sometimes left out of the numbering)
+_MAX_WEEK_STEP = 2
+# Upper bound on the text after the last row that still belongs to it
+_LAST_ROW_CHARS = 300
+_MAX_TOPIC_CHARS = 100
+
+# Lesson-plan table columns, recognised by their header
+_TOPIC_COLUMN = re.compile(r'topic|content|theme|title|description|lesson|subject', re.IGNORECASE)
+_ACTIVITY_COLUMN = re.compile(r'assess|deliverable|due|activit|assignment|remark|exam|quiz|task', re.IGNORECASE)
+_DATE_COLUMN = re.compile(r'date', re.IGNORECASE)
+
+# Milestone type by the first listed prefix that starts a word of the
+# assessment name, so "Final exam" is an exam but "Final project" a project
+_MILESTONE_TYPES = (
+    ("exam", "Exam"),
+    ("mid", "Exam"),
+    ("quiz", "Quiz"),
+    ("test", "Quiz"),
+    ("project", "Project"),
+    ("proposal", "Project"),
+    ("presentation", "Presentation"),
+    ("assignment", "Assignment"),
+    ("report", "Assignment"),
+    ("final", "Exam"),
+)
+# Share of the confidence lost when every milestone is doubtful (of unknown
+# type, or a second one of the same type in the same week)
+_DOUBTFUL_MILESTONE_PENALTY = 0.5
+
+
+def _milestone_type(name: str) -> Optional[str]:
+    """Type of an assessment name, or None for generic names such as "Submission" """
+    words = name.lower().split()
+    for prefix, label in _MILESTONE_TYPES:
+        if any(word.startswith(prefix) for word in words):
+            return label
+    return None
+
+
+def _milestone_confidence(milestones: List[Dict], unknown: int) -> float:
+    """Confidence factor for milestones, of which unknown have no recognised type.
+
+    Milestones of unknown type, and repeats of a type within a week (an
+    assessment name split in two), suggest the vocabulary misread the
+    schedule.
+    """
+    if not milestones:
+        return 1.0
+    repeated = len(milestones) - len({(m["week"], m["type"]) for m in milestones})
+    doubtful = min(unknown + repeated, len(milestones))
+    return 1.0 - _DOUBTFUL_MILESTONE_PENALTY * doubtful / len(milestones)
+
+
+def _longest_week_run(matches: List[re.Match]) -> List[re.Match]:
+    """Longest run of consecutive matches whose week numbers step forward by 1-2.
+
+    The lesson-plan table is the longest such run; stray references such as
+    "quiz in Week 5" elsewhere in the outline break the run and are ignored.
+    """
+    best, current = [], []
+    for match in matches:
+        week = int(match.group(1))
+        if current:
+            previous = int(current[-1].group(1))
+            if not 0 < week - previous <= _MAX_WEEK_STEP:
+                if len(current) > len(best):
+                    best = current
+                current = []
+        current.append(match)
+    return current if len(current) > len(best) else best
+
+
+def _find_column(headers: List[str], pattern: re.Pattern, exclude: List[int]) -> int:
+    for index, header in enumerate(headers):
+        if index not in exclude and pattern.search(header):
+            return index
+    return -1
+
+
+def schedule_from_table(headers: List[str], rows: List[Dict]) -> Tuple[Dict, float]:
+    """Build the schedule from structured lesson-plan rows (see table_extractor).
+
+    The topic comes from the topic-like column (else the first non-date
+    column), activities from assessment-like columns, and milestones from
+    the assessment vocabulary in those columns, dated from the date column
+    when the cell itself has no date.
+    """
+    date_column = _find_column(headers, _DATE_COLUMN, [])
+    topic_column = _find_column(headers, _TOPIC_COLUMN, [date_column])
+    if topic_column < 0:
+        topic_column = next((i for i in range(len(headers)) if i != date_column), -1)
+    activity_columns = [
+        i for i, header in enumerate(headers)
+        if i not in (date_column, topic_column) and _ACTIVITY_COLUMN.search(header)
+    ]
+
+    weekly_plan, milestones, seen_weeks, unknown = [], [], set(), 0
+    for row in rows:
+        week, cells = row["week"], row["cells"]
+        if week in seen_weeks:
+            continue
+        seen_weeks.add(week)
+        cell = lambda i: cells[i] if 0 <= i < len(cells) else ""
+        row_text = " ".join(cells)
+        topic = cell(topic_column)[:_MAX_TOPIC_CHARS] or f"Week {week}"
+        if _RECESS.search(row_text):
+            topic = "Recess Week"
+
+        activities = [cell(i) for i in activity_columns if cell(i)]
+        sources = " ".join(activities) if activity_columns else row_text
+        for assessment in _ASSESSMENT.finditer(sources):
+            description = assessment.group(0).strip()
+            date = _DATE.search(sources, assessment.end(), assessment.end() + 40)
+            if date:
+                description = f"{description} ({date.group(0)})"
+            elif cell(date_column):
+                description = f"{description} ({cell(date_column)})"
+            if any(m["description"] == description and m["week"] == week for m in milestones):
+                continue
+            kind = _milestone_type(assessment.group(1))
+            unknown += kind is None
+            milestones.append({"type": kind or "Assignment", "description": description, "week": week})
+        weekly_plan.append({"week": week, "topic": topic, "activities": activities})
+
+    if not weekly_plan:
+        return {"milestones": [], "weekly_plan": []}, 0.0
+    # Rows come from a detected table, so only coverage and the milestones'
+    # types limit confidence
+    coverage = min(len(weekly_plan) / 10, 1.0)
+    confidence = coverage * (_milestone_confidence(milestones, unknown) if milestones else 0.75)
+    return {"milestones": milestones, "weekly_plan": weekly_plan}, round(confidence, 2)
+
+
+def extract_schedule(text: str) -> Tuple[Dict, float]:
+    """Extract {"milestones": [...], "weekly_plan": [...]} from preprocessed text.
+
+    Lesson-plan tables already restructured by table_extractor are used
+    directly. Otherwise the flattened text is scanned for "Week N" rows.
+    Returns the schedule and a confidence in [0, 1] that it captured the
+    lesson plan: more consecutive weeks and at least one assessment give
+    higher confidence; milestones of unknown or repeated type give lower.
+    """
+    headers, rows = table_extractor.parse_tables(text)
+    if len(rows) >= 3:
+        return schedule_from_table(headers, rows)
+
+    run = _longest_week_run(list(_WEEK.finditer(text)))
+    weekly_plan, milestones, unknown = [], [], 0
+    row_lengths = [b.start() - a.end() for a, b in zip(run, run[1:])]
+    # The last row has no following "Week" to stop at: bound it by the page
+    # end and the typical row length of the table
+    last_row_chars = min(_LAST_ROW_CHARS, int(1.5 * sum(row_lengths) / len(row_lengths))) if row_lengths else _LAST_ROW_CHARS
+    for i, match in enumerate(run):
+        week = int(match.group(1))
+        if i + 1 < len(run):
+            end = run[i + 1].start()
+        else:
+            end = min(len(text), match.end() + last_row_chars)
+            page_end = text.find("\f", match.end(), end)
+            end = page_end if page_end >= 0 else end
+        row = text[match.end():end].strip(" \f-:;,.")
+
+        assessments = list(_ASSESSMENT.finditer(row))
+        topic_end = assessments[0].start() if assessments and assessments[0].start() > 10 else len(row)
+        topic = row[:topic_end].strip(" -:;,.")[:_MAX_TOPIC_CHARS] or f"Week {week}"
+        if _RECESS.search(row):
+            topic = "Recess Week"
+
+        activities = []
+        for assessment in assessments:
+            description = assessment.group(0).strip()
+            date = _DATE.search(row, assessment.end(), assessment.end() + 40)
+            if date:
+                description = f"{description} ({date.group(0)})"
+            if description in activities:
+                continue
+            activities.append(description)
+            kind = _milestone_type(assessment.group(1))
+            unknown += kind is None
+            milestones.append({"type": kind or "Assignment", "description": description, "week": week})
+
+        weekly_plan.append({"week": week, "topic": topic, "activities": activities})
+
+    if not weekly_plan:
+        return {"milestones": [], "weekly_plan": []}, 0.0
+
+    coverage = min(len({row["week"] for row in weekly_plan}) / 10, 1.0)
+    confidence = coverage * (_milestone_confidence(milestones, unknown) if milestones else 0.5)
+    return {"milestones": milestones, "weekly_plan": weekly_plan}, round(confidence, 2)
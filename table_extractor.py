@@ -0,0 +1,215 @@
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Positioned text runs as returned by the extraction backends' page_runs():
+# (x0, x1, top, text) in PDF points, y growing upwards
+Run = Tuple[float, float, float, str]
+
+# Bumped whenever the restructured page text changes, so cached pages from
+# an older layout are not reused
+LAYOUT_VERSION = "tables-1"
+
+# Pages are only laid out when some line starts with a lesson-plan word
+_CANDIDATE = re.compile(r'^\s*(?:Week|Wk|Session|Lesson)\b', re.IGNORECASE | re.MULTILINE)
+_HEADER_FIRST = re.compile(r'^(Week|Wk|Session|Lesson)\b', re.IGNORECASE)
+_ROW_START = re.compile(r'^(?:(?:Week|Wk|Session|Lesson)\s*)?(\d{1,2})\b', re.IGNORECASE)
+_CELL_UNSAFE = re.compile(r'\s*[();]+\s*')
+_SPACES = re.compile(r'\s+')
+
+# Compact form written into the page text in place of the flattened table.
+# It survives preprocess_text (which keeps letters, digits and .,-:;()) and
+# is parsed back by parse_tables(). Header names are lower-cased so column
+# titles such as "Assessment" are not taken for section headings.
+_COMPACT_HEADER = "Lesson plan table ({columns}):"
+_COMPACT_TABLE = re.compile(r'Lesson plan table \(([^()]*)\):', re.IGNORECASE)
+_COMPACT_ROW = re.compile(r'\s*(?:Week|Wk|Session|Lesson) (\d{1,2}) \(([^()]*)\)', re.IGNORECASE)
+
+_LINE_TOLERANCE = 3.0   # points between tops of runs on the same line
+_COLUMN_TOLERANCE = 4.0  # points a run may start left of its column
+# A line further below the previous one than this many times the widest
+# line spacing inside the table so far (a page footer, say) ends the table
+_GAP_FACTOR = 1.5
+
+
+def may_contain_table(text: str) -> bool:
+    """Cheap pre-check on a page's plain text before asking for positioned runs"""
+    return _CANDIDATE.search(text) is not None
+
+
+def _group_lines(runs: Sequence[Run]) -> List[List[Run]]:
+    """Group runs into lines (top to bottom), each line sorted left to right"""
+    lines: List[List[Run]] = []
+    for run in sorted(runs, key=lambda r: (-r[2], r[0])):
+        if not run[3].strip():
+            continue
+        if lines and abs(lines[-1][0][2] - run[2]) <= _LINE_TOLERANCE:
+            lines[-1].append(run)
+        else:
+            lines.append([run])
+    return [sorted(line, key=lambda r: r[0]) for line in lines]
+
+
+def _line_text(line: List[Run]) -> str:
+    return " ".join(run[3].strip() for run in line)
+
+
+def _column_of(run: Run, starts: List[float]) -> Tuple[Optional[int], bool]:
+    """Index of the column a run starts in (None left of the table) and whether it straddles columns"""
+    column = None
+    for index, start in enumerate(starts):
+        if run[0] >= start - _COLUMN_TOLERANCE:
+            column = index
+    if column is None:
+        return None, False
+    # Run ends reported by the backends may overshoot a little; prose
+    # running across the page overshoots by most of its width
+    overshoot = run[1] - starts[column + 1] if column + 1 < len(starts) else 0
+    return column, overshoot > max(_COLUMN_TOLERANCE, 0.25 * (run[1] - run[0]))
+
+
+def detect_table(runs: Sequence[Run]) -> Optional[Dict]:
+    """Find a lesson-plan table in one page's positioned text.
+
+    The table is recognised by a header line whose first cell is "Week"
+    (or Session/Lesson/Wk); column boundaries come from the header cells'
+    x positions. Each line whose first-column text is a week number starts
+    a row, and wrapped cell lines below it (top-aligned cells) are added to
+    that row's columns. The table ends at the first line that does not fit
+    the columns, has first-column text that is not a week number (such as
+    "Page 2 of 9"), or sits further below the previous line than the rows
+    are spaced. Returns {"label", "headers", "rows", "first_line",
+    "last_line", "lines"}, with rows as {"week": int, "cells": [str, ...]},
+    or None. The first cell holds whatever shares the week column besides
+    the number (backends sometimes merge a narrow date column into it).
+    """
+    lines = _group_lines(runs)
+    for header_index, line in enumerate(lines):
+        if len(line) >= 3 and _HEADER_FIRST.match(line[0][3].strip()):
+            break
+    else:
+        return None
+
+    header = lines[header_index]
+    starts = [run[0] for run in header]
+    headers = [run[3].strip() for run in header]
+    label = _HEADER_FIRST.match(headers[0]).group(1).title()
+    rows: List[Dict] = []
+    last_line = header_index
+    previous_top, spacing = header[0][2], 0.0
+    for index in range(header_index + 1, len(lines)):
+        line = lines[index]
+        gap = previous_top - line[0][2]
+        if spacing and gap > _GAP_FACTOR * spacing:
+            break
+        placed = [_column_of(run, starts) for run in line]
+        columns = [column for column, _ in placed]
+        # A lone run across several columns is prose after the table; within
+        # a row, neighbouring cells merged by the backend stay in the row
+        if None in columns or (len(line) == 1 and placed[0][1]):
+            break
+        first = line[0][3].strip() if columns[0] == 0 else ""
+        match = _ROW_START.match(first)
+        if match:
+            rows.append({"week": int(match.group(1)), "cells": [[] for _ in starts]})
+            first_remainder = first[match.end():].strip()
+            line = [(run[0], run[1], run[2], first_remainder) if i == 0 else run for i, run in enumerate(line)]
+        elif not rows or first:
+            break
+        for run, column in zip(line, columns):
+            if run[3].strip():
+                rows[-1]["cells"][column].append(run[3].strip())
+        last_line = index
+        previous_top, spacing = line[0][2], max(spacing, gap)
+
+    if len(rows) < 2:
+        return None
+    for row in rows:
+        row["cells"] = [" ".join(parts) for parts in row["cells"]]
+    return {
+        "label": label,
+        "headers": headers,
+        "rows": rows,
+        "first_line": header_index,
+        "last_line": last_line,
+        "lines": lines,
+    }
+
+
+def _clean_cell(text: str) -> str:
+    return _SPACES.sub(" ", _CELL_UNSAFE.sub(", ", text)).strip(" ,") or "-"
+
+
+def render_compact(table: Dict) -> str:
+    """The table as one short line per row, e.g. "Week 3 (9 Jan; Relational algebra; Quiz 1)" """
+    # The week column is left out unless something besides the number shares it
+    first = 0 if any(row["cells"][0] for row in table["rows"]) else 1
+    headers = [_clean_cell(name).lower() for name in table["headers"][first:]]
+    lines = [_COMPACT_HEADER.format(columns="; ".join(headers))]
+    for row in table["rows"]:
+        cells = "; ".join(_clean_cell(cell) for cell in row["cells"][first:])
+        lines.append(f"{table['label']} {row['week']} ({cells})")
+    return "\n".join(lines)
+
+
+def _find_line(text: str, line: List[Run], start: int) -> int:
+    """Position of a laid-out line in the backend's plain text (whitespace-insensitive), or -1"""
+    words = _line_text(line).split()[:8]
+    if not words:
+        return -1
+    match = re.compile(r'\s+'.join(re.escape(word) for word in words)).search(text, start)
+    return match.start() if match else -1
+
+
+def restructure_page(text: str, runs: Sequence[Run]) -> str:
+    """Replace a flattened lesson-plan table in a page's text with its compact rows.
+
+    The table's span in the plain text runs from its header line to the
+    first line laid out below the table that appears after it in the text
+    (or the end of the page). If the header cannot be located, the compact
+    rows are appended and the text is left as it is.
+    """
+    table = detect_table(runs)
+    if table is None:
+        return text
+    compact = render_compact(table)
+    start = _find_line(text, table["lines"][table["first_line"]], 0)
+    if start < 0:
+        return f"{text}\n{compact}"
+    end = len(text)
+    for line in table["lines"][table["last_line"] + 1:]:
+        position = _find_line(text, line, start + 1)
+        if position >= 0:
+            end = position
+            break
+    return f"{text[:start]}{compact}\n{text[end:]}"
+
+
+def parse_tables(text: str) -> Tuple[List[str], List[Dict]]:
+    """Read compact lesson-plan tables back out of (preprocessed) document text.
+
+    Returns the column headers of the first table and the rows of every
+    table (a table continued over several pages repeats its header), as
+    {"week": int, "cells": [str, ...]} with cells aligned to the headers
+    (empty cells as "").
+    """
+    headers: List[str] = []
+    rows: List[Dict] = []
+    for table in _COMPACT_TABLE.finditer(text):
+        columns = [column.strip() for column in table.group(1).split(";")]
+        if not headers:
+            headers = columns
+        position = table.end()
+        while True:
+            row = _COMPACT_ROW.match(text, position)
+            if row is None:
+                break
+            cells = [cell.strip() for cell in row.group(2).split(";")]
+            cells = ["" if cell == "-" else cell for cell in cells]
+            rows.append({"week": int(row.group(1)), "cells": cells})
+            position = row.end()
+    return headers, rows
+
+
+def is_table_header(line: str) -> bool:
+    """Whether a (preprocessed) line is a compact table header written by render_compact()"""
+    return _COMPACT_TABLE.match(line) is not None
@@ -0,0 +1,160 @@
+import os
+import re
+import math
+import logging
+from collections import Counter, deque
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from chunking import PAGE_BREAK, estimate_tokens
+import table_extractor
+
+# Strip header, footer, page-number and copyright lines repeated across pages
+STRIP_BOILERPLATE = os.getenv('STRIP_BOILERPLATE', 'true').lower() in ('1', 'true', 'yes')
+# Only the first and last few lines of a page are header/footer candidates,
+# and only if they are this short
+EDGE_LINES = 3
+EDGE_MAX_CHARS = 120
+# A candidate line is boilerplate once it appears on this share of the pages
+# seen so far, and on at least BOILERPLATE_MIN_PAGES of them
+BOILERPLATE_SHARE = 0.5
+BOILERPLATE_MIN_PAGES = 3
+# Pages held back by the streaming normaliser so the first pages' headers
+# and footers are recognised before those pages are passed on
+LOOKAHEAD_PAGES = 3
+
+# Everything except word characters and .,-:;() becomes a single space; runs
+# of whitespace collapse with it, so one substitution per line normalises it
+_NON_TEXT = re.compile(r'[^\w.,\-:;()]+')
+# A trailing page number ("Page 3 of 12", "- 3 -") differs between otherwise
+# identical footers; other digits (years, course codes, week numbers) are kept
+_PAGE_NUMBER = re.compile(r'(?:\bpage\s*)?\b\d{1,4}(?:\s*of\s*\d{1,4})?[\s\-.]*$')
+# ...unless the number belongs to a word before it, as in "Week 3"
+_NUMBERED = re.compile(r'\b(?:week|wk|session|lesson|chapter|unit|lecture|topic)\s*$')
+
+
+def _lines(page: str) -> List[str]:
+    """A page's non-empty lines, normalised"""
+    lines = []
+    for line in page.split("\n"):
+        line = _NON_TEXT.sub(" ", line).strip()
+        if line:
+            lines.append(line)
+    return lines
+
+
+def _key(line: str) -> str:
+    """Repetition key of a line: lower-cased, with a trailing page number replaced by #"""
+    line = line.lower()
+    match = _PAGE_NUMBER.search(line)
+    if match is None or _NUMBERED.search(line, 0, match.start()):
+        return line
+    return f"{line[:match.start()]}#"
+
+
+def _edge_indices(lines: List[str]) -> List[int]:
+    """Indices of a page's header/footer candidate lines.
+
+    Short pages offer fewer candidates, so at least one line in the middle
+    of a page is never a candidate and no page is removed entirely.
+    """
+    count = len(lines)
+    edge = min(EDGE_LINES, (count - 1) // 2)
+    return [
+        index for index in (*range(edge), *range(count - edge, count))
+        if len(lines[index]) <= EDGE_MAX_CHARS
+    ]
+
+
+class TextNormaliser:
+    """Normalises extracted pages and removes boilerplate repeated across them.
+
+    Each line goes through one precompiled substitution (special characters
+    and whitespace runs become single spaces). Short lines near the top or
+    bottom of a page that recur, up to a trailing page number, on enough
+    pages (running headers, footers, "Page 3 of 12", copyright notices)
+    are dropped. Compact lesson-plan table headers are never dropped, since
+    a table continued over several pages repeats its header by design.
+    Pages left empty are dropped too, so their page breaks do not pile up.
+
+    stats reports pages, lines_removed, chars_saved and tokens_saved.
+    """
+
+    def __init__(self, strip_boilerplate: bool = None):
+        self.strip_boilerplate = STRIP_BOILERPLATE if strip_boilerplate is None else strip_boilerplate
+        self._counts = Counter()
+        self._pages_seen = 0
+        self._kept_chars = 0
+        self._removed_chars = 0
+        self.stats = {"pages": 0, "lines_removed": 0, "chars_saved": 0, "tokens_saved": 0}
+
+    def _observe(self, lines: List[str]):
+        self._pages_seen += 1
+        self._counts.update({_key(lines[index]) for index in _edge_indices(lines)})
+
+    def _is_boilerplate(self, line: str) -> bool:
+        threshold = max(BOILERPLATE_MIN_PAGES, math.ceil(BOILERPLATE_SHARE * self._pages_seen))
+        return self._counts[_key(line)] >= threshold and not table_extractor.is_table_header(line)
+
+    def _clean(self, lines: List[str]) -> str:
+        if self.strip_boilerplate:
+            edges = set(_edge_indices(lines))
+            removed = [index for index in edges if self._is_boilerplate(lines[index])]
+            for index in removed:
+                self._removed_chars += len(lines[index]) + 1
+                self.stats["tokens_saved"] += estimate_tokens(lines[index])
+            self.stats["lines_removed"] += len(removed)
+            lines = [line for index, line in enumerate(lines) if index not in removed]
+        text = " ".join(lines)
+        self._kept_chars += len(text)
+        self.stats["pages"] += 1
+        self.stats["chars_saved"] = self._removed_chars
+        return text
+
+    def normalise(self, text: str) -> str:
+        """Normalise a whole document whose pages are separated by PAGE_BREAK"""
+        pages = [_lines(page) for page in text.split(PAGE_BREAK)]
+        if self.strip_boilerplate:
+            for lines in pages:
+                self._observe(lines)
+        text = PAGE_BREAK.join(page for page in map(self._clean, pages) if page)
+        self._log()
+        return text
+
+    def iter_pages(self, pages: Iterable[Tuple[int, str]]) -> Iterator[Tuple[int, str]]:
+        """Lazily normalise a (page_number, text) stream such as PDFProcessor.iter_pages().
+
+        Pages are passed on LOOKAHEAD_PAGES behind the stream, each judged
+        against the repetitions seen so far; empty pages are skipped.
+        """
+        pending = deque()
+        for number, text in pages:
+            lines = _lines(text)
+            if self.strip_boilerplate:
+                self._observe(lines)
+            pending.append((number, lines))
+            yield from self._release(pending, LOOKAHEAD_PAGES)
+        yield from self._release(pending, 0)
+        self._log()
+
+    def _release(self, pending: deque, keep: int) -> Iterator[Tuple[int, str]]:
+        """Clean and pass on held-back pages until keep are left, skipping empty ones"""
+        while len(pending) > keep:
+            number, lines = pending.popleft()
+            text = self._clean(lines)
+            if text:
+                yield number, text
+
+    def _log(self):
+        if self.stats["lines_removed"]:
+            total = self._kept_chars + self._removed_chars
+            logging.info(
+                f"Normaliser removed {self.stats['lines_removed']} boilerplate lines from {self.stats['pages']} pages: "
+                f"{self.stats['chars_saved']} characters (~{self.stats['tokens_saved']} tokens, "
+                f"{100 * self._removed_chars / max(total, 1):.1f}%)"
+            )
+
+
+def normalise_text(text: str) -> Tuple[str, Dict]:
+    """Normalise a PAGE_BREAK-separated document, returning the text and its stats"""
+    normaliser = TextNormaliser()
+    return normaliser.normalise(text), normaliser.stats
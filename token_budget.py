@@ -0,0 +1,118 @@
+import os
+import re
+import logging
+from typing import Dict
+
+from chunking import estimate_tokens
+
+# Per model: context window (input + output tokens), usual completion
+# length and input-token budget per chunk. The completion length is what
+# max_tokens is set to when the prompt leaves room for it; it is lowered,
+# down to MIN_OUTPUT_TOKENS, when it does not. Documents that fit in one
+# chunk budget are analysed in a single call; longer ones are split and
+# mapped over in parallel. Chunk budgets sit well inside the context window
+# so that the prompt template and the completion still fit.
+MODEL_LIMITS = {
+    "google/gemini-pro": {"context_window": 32768, "output": 4000, "chunk": 12000},
+    "anthropic/claude-3.5-sonnet:beta": {"context_window": 200000, "output": 3000, "chunk": 24000},
+    "google/gemini-flash-1.5": {"context_window": 1000000, "output": 1500, "chunk": 32000},
+}
+DEFAULT_LIMITS = {"context_window": 8192, "output": 2000, "chunk": 12000}
+
+# Share of the context window left unused to absorb tokenizer error
+SAFETY_MARGIN = 0.05
+# A request that cannot leave this much room for the completion is not sent
+MIN_OUTPUT_TOKENS = int(os.getenv('MIN_OUTPUT_TOKENS', '512'))
+# Inputs at most this fraction over the limit are trimmed instead of chunked
+TRIM_TOLERANCE = float(os.getenv('TOKEN_TRIM_TOLERANCE', '0.1'))
+
+_SENTENCE_END = re.compile(r'[.;:]\s')
+
+
+class ContextLimitError(Exception):
+    """A prompt does not fit the model's context window"""
+
+
+def _windows_from_env() -> Dict[str, int]:
+    """Parse MODEL_CONTEXT_WINDOWS, e.g. "google/gemini-pro=32768,my/model=8192" """
+    windows = {}
+    for item in os.getenv('MODEL_CONTEXT_WINDOWS', '').split(','):
+        name, _, value = item.partition('=')
+        if name.strip() and value.strip().isdigit():
+            windows[name.strip()] = int(value)
+    return windows
+
+
+def model_limits(model: str) -> Dict[str, int]:
+    """{"context_window", "output", "chunk"} for a model (MODEL_CONTEXT_WINDOWS overrides the window)"""
+    limits = dict(MODEL_LIMITS.get(model, DEFAULT_LIMITS))
+    limits["context_window"] = _windows_from_env().get(model, limits["context_window"])
+    return limits
+
+
+def usable_context(model: str) -> int:
+    """Context window minus the safety margin"""
+    return int(model_limits(model)["context_window"] * (1 - SAFETY_MARGIN))
+
+
+def input_limit(model: str, prompt_tokens: int) -> int:
+    """Most document tokens one request may carry: the chunk budget, capped so the usual output still fits"""
+    room = usable_context(model) - model_limits(model)["output"] - prompt_tokens
+    return max(min(model_limits(model)["chunk"], room), 1)
+
+
+def output_budget(model: str, prompt: str) -> int:
+    """max_tokens for a prompt: the model's usual output, lowered so prompt + output fits the window.
+
+    Raises ContextLimitError (before anything is sent) if fewer than
+    MIN_OUTPUT_TOKENS would be left for the completion.
+    """
+    output = model_limits(model)["output"]
+    prompt_tokens = estimate_tokens(prompt)
+    room = usable_context(model) - prompt_tokens
+    if room < MIN_OUTPUT_TOKENS:
+        raise ContextLimitError(
+            f"Prompt of ~{prompt_tokens} tokens leaves {max(room, 0)} of {model}'s "
+            f"{model_limits(model)['context_window']}-token context for the completion"
+        )
+    if room < output:
+        logging.info(f"Token budget: {prompt_tokens}-token prompt, max_tokens lowered to {room} for {model}")
+        return room
+    return output
+
+
+def trim_to_tokens(text: str, max_tokens: int) -> str:
+    """Longest prefix of text within max_tokens, cut at a sentence end where possible"""
+    tokens = estimate_tokens(text)
+    while tokens > max_tokens:
+        cut = int(len(text) * max_tokens / tokens * 0.98)
+        ends = [match.end() for match in _SENTENCE_END.finditer(text, 0, cut)]
+        # Only back off to a sentence end if it keeps most of the prefix
+        text = text[:ends[-1]].rstrip() if ends and ends[-1] > cut * 0.9 else text[:cut]
+        tokens = estimate_tokens(text)
+    return text
+
+
+def plan_input(model: str, analysis: str, text: str, prompt_tokens: int) -> Dict:
+    """Decide how one analysis input is sent: "full", "trimmed" or "chunked".
+
+    Inputs within input_limit() go in full. Inputs up to TRIM_TOLERANCE
+    over it are trimmed to fit, which is cheaper than a map-reduce for a
+    little overflow; longer ones are chunked. Returns {"mode", "text",
+    "input_tokens", "limit"} and logs the decision; the completion budget
+    is set per request by output_budget().
+    """
+    tokens = estimate_tokens(text)
+    limit = input_limit(model, prompt_tokens)
+    if tokens <= limit:
+        mode = "full"
+    elif tokens <= limit * (1 + TRIM_TOLERANCE):
+        mode = "trimmed"
+        text = trim_to_tokens(text, limit)
+    else:
+        mode = "chunked"
+    logging.info(
+        f"Token budget for {analysis} on {model}: {tokens} input + {prompt_tokens} prompt tokens, "
+        f"limit {limit}, window {model_limits(model)['context_window']}: {mode}"
+    )
+    return {"mode": mode, "text": text, "input_tokens": tokens, "limit": limit}
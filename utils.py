@@ -16,6 +16,26 @@ def format_summary(summary_data: dict) -> str:
         return summary_data['Summary']
     return "No summary available"
 
+def peek_header(uploaded_file, length: int = 5) -> bytes:
+    """Read the first bytes of an upload without consuming or copying the rest"""
+    stream = getattr(uploaded_file, 'stream', uploaded_file)  # Werkzeug FileStorage
+    position = stream.tell()
+    stream.seek(0)
+    header = stream.read(length)
+    stream.seek(position)
+    return header
+
+def upload_size(uploaded_file) -> int:
+    """Size of an upload, from its metadata or by seeking to the end of its stream"""
+    size = getattr(uploaded_file, 'size', None)
+    if size is not None:
+        return size
+    stream = getattr(uploaded_file, 'stream', uploaded_file)
+    position = stream.tell()
+    size = stream.seek(0, 2)
+    stream.seek(position)
+    return size
+
 def validate_pdf_file(uploaded_file) -> bool:
     """
     Validate uploaded file for security
@@ -26,24 +46,25 @@ def validate_pdf_file(uploaded_file) -> bool:
     try:
         # Check file size (e.g., 10MB limit)
         MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB in bytes
-        if uploaded_file.size > MAX_FILE_SIZE:
+        if upload_size(uploaded_file) > MAX_FILE_SIZE:
             return False
             
+        # Werkzeug uploads have .filename (their .name is the form field), Streamlit uploads have .name
+        name = getattr(uploaded_file, 'filename', None) or getattr(uploaded_file, 'name', '') or ''
+            
         # Check file type using file extension and MIME type
-        file_type, _ = mimetypes.guess_type(uploaded_file.name)
+        file_type, _ = mimetypes.guess_type(name)
         if file_type != 'application/pdf':
             return False
             
         # Check filename for security
-        if not re.match(r'^[\w\-. ]+\.pdf$', uploaded_file.name):
+        if not re.match(r'^[\w\-. ]+\.pdf$', name):
             return False
             
-        # Additional check: try to read first few bytes
+        # Additional check: peek at the first few bytes of the same buffer
         try:
-            content_start = uploaded_file.read(5)
-            uploaded_file.seek(0)  # Reset file pointer
             # Check for PDF file signature
-            if content_start[:4] != b'%PDF':
+            if peek_header(uploaded_file)[:4] != b'%PDF':
                 return False
         except:
             return False
@@ -192,11 +192,11 @@ class VisualizationHandler:
                 mode='text+markers',
                 text=[item['word'] for item in keywords],
                 textfont=dict(
-                    size=[score['score'] * 0.4 for score in keywords],
+                    size=[max(score['score'] * 0.4, 1) for score in keywords],
                     color='darkblue'
                 ),
                 marker=dict(
-                    size=[score['score'] * 0.8 for score in keywords],
+                    size=[max(score['score'] * 0.8, 1) for score in keywords],
                     color=['#3366CC', '#FF6B6B', '#4ECDC4', '#FF9F40', '#FFB6C1', 
                            '#98FB98', '#DDA0DD', '#B0C4DE'],
                     opacity=0.6